@@ -0,0 +1,76 @@
+"""Benchmark getFeedSkeleton latency under concurrent load.
+
+Start the server first (with the firehose running), e.g.
+
+    uvicorn server.asgi:app --port 8001        # async path
+    flask run                                  # sync path, for comparison
+
+then run
+
+    python bench_skeleton.py --url http://127.0.0.1:8001 --feed <WHATS_ALF_URI> --concurrency 64 --requests 5000
+"""
+import argparse
+import asyncio
+import re
+import statistics
+import time
+
+import httpx
+
+
+def _firehose_events(metrics_text: str) -> float:
+    return sum(float(value) for value in re.findall(r'^firehose_events_total\{[^}]*\} (\S+)$', metrics_text, re.M))
+
+
+async def _worker(client: httpx.AsyncClient, params: dict, remaining: list, latencies: list, errors: list) -> None:
+    while remaining:
+        remaining.pop()
+        start = time.perf_counter()
+        try:
+            response = await client.get('/xrpc/app.bsky.feed.getFeedSkeleton', params=params)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+def _percentile(values: list, percentile: float) -> float:
+    # 'inclusive' interpolates between observed values; the default extrapolates past them on small samples
+    return statistics.quantiles(values, n=100, method='inclusive')[int(percentile) - 1] if len(values) > 1 else values[0]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8001')
+    parser.add_argument('--feed', required=True)
+    parser.add_argument('--limit', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    params = {'feed': args.feed, 'limit': args.limit}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        events_before = _firehose_events((await client.get('/metrics')).text)
+
+        latencies, errors = [], []
+        remaining = list(range(args.requests))
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _worker(client, params, remaining, latencies, errors) for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+        events_after = _firehose_events((await client.get('/metrics')).text)
+
+    print(f'{len(latencies)} requests, concurrency {args.concurrency}, {len(errors)} errors')
+    print(f'throughput: {len(latencies) / elapsed:.1f} req/s')
+    for percentile in (50, 95, 99):
+        print(f'p{percentile}: {_percentile(latencies, percentile) * 1000:.2f} ms')
+    print(f'firehose events ingested during run: {events_after - events_before:.0f} '
+          f'({(events_after - events_before) / elapsed:.1f}/s)')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
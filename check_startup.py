@@ -0,0 +1,92 @@
+"""Import-time budget check for the feed server.
+
+Imports each server entry point in a fresh interpreter with the ingest thread
+suppressed, and fails (exit code 1) if
+
+  * the import takes longer than the budget, or
+  * a module that should only load on the ingest thread (atproto, the
+    relevance filter) is imported on the serving path.
+
+    python check_startup.py                 # default budget 0.75s
+    python check_startup.py --budget 0.5 --top 15
+
+Run it from the repository root before merging anything that adds imports to
+server/app.py, server/asgi.py or the modules they import.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import List, Optional
+
+ENTRY_POINTS = ('server.app', 'server.asgi')
+# Must not be imported until ingest starts
+LAZY_MODULES = ('atproto', 'server.data_filter', 'server.data_stream', 'server.jetstream', 'numpy')
+
+DEFAULT_BUDGET = float(os.environ.get('IMPORT_BUDGET_SECONDS', 0.75))
+
+_CHILD = """
+import json, sys, threading, time
+threading.Thread.start = lambda self: None  # keep the ingest thread from starting
+start = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)}))
+sys.stdout.flush()
+import os; os._exit(0)
+"""
+
+
+def _slowest_imports(importtime_log: str, top: int) -> List[str]:
+    rows = []
+    for line in importtime_log.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    rows.sort(reverse=True)
+    return [f'{cumulative / 1e6:8.3f}s {name}' for cumulative, name in rows[:top]]
+
+
+def check(entry_point: str, budget: float, top: int) -> bool:
+    env = dict(os.environ)
+    env.setdefault('HOSTNAME', 'example.com')
+    env.setdefault('WHATS_ALF_URI', 'at://did:plc:example/app.bsky.feed.generator/example')
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD, entry_point],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0 or not result.stdout.strip():
+        print(f'FAIL {entry_point}: import failed\n{result.stderr[-2000:]}')
+        return False
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    seconds = report['seconds']
+    eager = [name for name in LAZY_MODULES if name in report['modules']]
+
+    ok = seconds <= budget and not eager
+    print(f'{"ok  " if ok else "FAIL"} {entry_point}: {seconds:.3f}s (budget {budget:.3f}s)')
+    if eager:
+        print(f'     imported on the serving path: {", ".join(eager)}')
+    if not ok or top:
+        for line in _slowest_imports(result.stderr, top or 10):
+            print(f'     {line}')
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help='seconds per entry point')
+    parser.add_argument('--top', type=int, default=0, help='always list the N slowest imports')
+    parser.add_argument('entry_points', nargs='*', default=list(ENTRY_POINTS))
+    args = parser.parse_args(argv)
+
+    results = [check(entry_point, args.budget, args.top) for entry_point in args.entry_points]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
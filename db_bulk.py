@@ -0,0 +1,193 @@
+"""Streaming bulk export/import for the feed and content databases.
+
+Replaces the row-by-row peewee edits in add_post.ipynb / db_edit.ipynb.
+
+Export a table as JSON lines or CSV (constant memory):
+
+    python db_bulk.py export post --db feed_database2.db --out posts.jsonl
+    python db_bulk.py export postcontent --db search/content_database.db --format csv --out content.csv
+
+Import it back (batched executemany, secondary indexes rebuilt once at the end,
+duplicates on the table's natural key skipped):
+
+    python db_bulk.py import post --db feed_database2.db --in posts.jsonl
+
+The table has to exist already (start the server / search app once to create the schema).
+"""
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+# Natural key each table is de-duplicated on when importing
+DEDUPE_KEYS = {
+    'post': 'uri',
+    'postcontent': 'cid',
+    'subscriptionstate': 'service',
+}
+# Tables where an imported row replaces the existing one instead of being skipped
+REPLACE_EXISTING = {'subscriptionstate'}
+
+BATCH_SIZE = 50000
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+    if not columns:
+        raise SystemExit(f'Table "{table}" does not exist in this database.')
+    # auto-increment ids are not meaningful across databases
+    return [column for column in columns if column != 'id']
+
+
+def _report(verb: str, rows: int, start: float, final: bool = False) -> None:
+    elapsed = time.perf_counter() - start
+    end = '\n' if final else '\r'
+    print(f'{verb} {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)', end=end, file=sys.stderr)
+
+
+def export_table(db_path: str, table: str, out, fmt: str = 'jsonl') -> int:
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    columns = _columns(conn, table)
+    cursor = conn.execute(f'SELECT {", ".join(columns)} FROM "{table}" ORDER BY rowid')
+    cursor.arraysize = 10000
+
+    writer = csv.writer(out) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+
+    start = time.perf_counter()
+    count = 0
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        if writer:
+            writer.writerows(rows)
+        else:
+            out.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+        count += len(rows)
+        _report('Exported', count, start)
+
+    _report('Exported', count, start, final=True)
+    conn.close()
+    return count
+
+
+def _read_rows(source, fmt: str, columns: List[str]) -> Iterator[tuple]:
+    if fmt == 'csv':
+        for record in csv.DictReader(source):
+            # CSV has no NULL; treat empty cells as NULL
+            yield tuple(record.get(column) or None for column in columns)
+    else:
+        for line in source:
+            if line.strip():
+                record = json.loads(line)
+                yield tuple(record.get(column) for column in columns)
+
+
+def _secondary_indexes(conn: sqlite3.Connection, table: str) -> Dict[str, str]:
+    return {
+        name: sql
+        for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+        )
+    }
+
+
+def import_table(db_path: str, table: str, source, fmt: str = 'jsonl', batch_size: int = BATCH_SIZE) -> int:
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')  # 256 MB
+
+    columns = _columns(conn, table)
+    key = DEDUPE_KEYS.get(table)
+    column_list = ', '.join(columns)
+    placeholders = ', '.join('?' for _ in columns)
+
+    start = time.perf_counter()
+    count = 0
+    conn.execute('BEGIN')
+    try:
+        # Stage everything in an index-free temp table, then merge once
+        conn.execute(f'CREATE TEMP TABLE import_rows AS SELECT {column_list} FROM "{table}" WHERE 0')
+
+        batch = []
+        for row in _read_rows(source, fmt, columns):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                conn.executemany(f'INSERT INTO import_rows ({column_list}) VALUES ({placeholders})', batch)
+                count += len(batch)
+                batch.clear()
+                _report('Staged', count, start)
+        if batch:
+            conn.executemany(f'INSERT INTO import_rows ({column_list}) VALUES ({placeholders})', batch)
+            count += len(batch)
+        _report('Staged', count, start, final=True)
+
+        # Defer index maintenance: drop secondary indexes, bulk insert, rebuild once
+        indexes = _secondary_indexes(conn, table)
+        for name in indexes:
+            conn.execute(f'DROP INDEX "{name}"')
+
+        if key is None:
+            conn.execute(f'INSERT INTO "{table}" ({column_list}) SELECT {column_list} FROM import_rows')
+        else:
+            if table in REPLACE_EXISTING:
+                conn.execute(f'DELETE FROM "{table}" WHERE {key} IN (SELECT {key} FROM import_rows)')
+            # first occurrence of each key wins; keys already present are skipped
+            conn.execute(
+                f'INSERT INTO "{table}" ({column_list}) '
+                f'SELECT {column_list} FROM import_rows '
+                f'WHERE rowid IN (SELECT min(rowid) FROM import_rows GROUP BY {key}) '
+                f'AND {key} NOT IN (SELECT {key} FROM "{table}" WHERE {key} IS NOT NULL)'
+            )
+        inserted = conn.execute('SELECT changes()').fetchone()[0]
+
+        for sql in indexes.values():
+            conn.execute(sql)
+
+        conn.execute('DROP TABLE import_rows')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    _report(f'Imported {inserted} new of', count, start, final=True)
+    return inserted
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('table', choices=sorted(DEDUPE_KEYS))
+    parser.add_argument('--db', required=True, help='SQLite database file')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default=None, help='default: from file extension')
+    parser.add_argument('--out', default='-', help='export destination (default stdout)')
+    parser.add_argument('--in', dest='source', default='-', help='import source (default stdin)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    path = args.out if args.command == 'export' else args.source
+    fmt = args.format or ('csv' if path.endswith('.csv') else 'jsonl')
+
+    if args.command == 'export':
+        if path == '-':
+            export_table(args.db, args.table, sys.stdout, fmt)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as out:
+                export_table(args.db, args.table, out, fmt)
+    else:
+        if path == '-':
+            import_table(args.db, args.table, sys.stdin, fmt, args.batch_size)
+        else:
+            with open(path, 'r', newline='', encoding='utf-8') as source:
+                import_table(args.db, args.table, source, fmt, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""Replay production getFeedSkeleton traffic against a synthetic feed database.
+
+Arrival times and `limit`s come from refresh_logs.csv and are replayed
+open-loop at --speed times real time: every request is sent at its scheduled
+time whether or not earlier ones have finished, and latency is measured from
+that scheduled time so queueing in front of the server is not hidden.
+
+Page loads (limit > 1) less than --session-gap seconds apart in the log are
+replayed as one scroll session that follows the previous response's cursor.
+--min-pages makes every scroll session go at least that deep, and --deep-fraction
+starts that share of sessions from a random point in the feed's history.
+
+Build a 5M-row synthetic database, start a local server on it (no ingest, no
+network) and replay the log at 50x, squeezing idle gaps to at most a minute:
+
+    python loadtest_skeleton.py --rows 5000000 --speed 50 --max-gap 60
+
+Compare with the Flask app, or target a server you started yourself:
+
+    python loadtest_skeleton.py --rows 5000000 --server flask --speed 50 --max-gap 60
+    python loadtest_skeleton.py --url http://127.0.0.1:8001 --feed "$WHATS_ALF_URI" --speed 10
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import random
+import signal
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+import httpx
+
+DEFAULT_FEED = 'at://did:plc:loadtest/app.bsky.feed.generator/loadtest'
+SKELETON_PATH = '/xrpc/app.bsky.feed.getFeedSkeleton'
+CURSOR_EOF = 'eof'
+
+# (seconds after replay start, limit); pages of one session are fetched in order
+Session = List[Tuple[float, int]]
+
+
+def load_log(path: str, since: Optional[datetime] = None) -> List[Tuple[datetime, int]]:
+    records = []
+    with open(path, newline='', encoding='utf-8') as fh:
+        for row in csv.DictReader(fh):
+            timestamp = datetime.fromisoformat(row['timestamp'])
+            if since is None or timestamp >= since:
+                records.append((timestamp, int(row['limit'])))
+    records.sort()
+    return records
+
+
+def build_sessions(records: List[Tuple[datetime, int]], speed: float, max_gap: Optional[float],
+                   session_gap: float) -> List[Session]:
+    """Turn log records into replay sessions, compressing time by *speed* and capping idle gaps at *max_gap*."""
+    sessions: List[Session] = []
+    open_session: Optional[Session] = None
+    offset = 0.0
+    previous = None
+    for timestamp, limit in records:
+        gap = 0.0 if previous is None else (timestamp - previous).total_seconds()
+        previous = timestamp
+        offset += (min(gap, max_gap) if max_gap is not None else gap) / speed
+
+        if limit > 1 and open_session is not None and gap <= session_gap:
+            open_session.append((offset, limit))
+            continue
+
+        session = [(offset, limit)]
+        sessions.append(session)
+        # limit=1 requests are the app polling for new posts, they never paginate
+        open_session = session if limit > 1 else None
+    return sessions
+
+
+def _synthetic_rows(rows: int, days: int, authors: int) -> Iterator[str]:
+    end = datetime.utcnow()
+    start = end - timedelta(days=days)
+    step = (end - start) / max(rows, 1)
+    for i in range(rows):
+        digest = hashlib.blake2b(i.to_bytes(8, 'little'), digest_size=16).hexdigest()
+        author = int(digest[:8], 16) % authors
+        indexed_at = start + step * i
+        yield json.dumps({
+            'uri': f'at://did:plc:loadtest{author:08d}/app.bsky.feed.post/{i:013x}',
+            'cid': f'bafyrei{digest}',
+            'reply_parent': None,
+            'reply_root': None,
+            'indexed_at': indexed_at.strftime('%Y-%m-%d %H:%M:%S.%f'),
+        }) + '\n'
+
+
+def build_synthetic_db(path: str, rows: int, days: int = 365, authors: int = 20000, rebuild: bool = False) -> None:
+    """Create (or reuse) a feed database with *rows* Post rows spread evenly over the last *days*."""
+    import peewee
+
+    import db_bulk
+    from server.database import Post, SubscriptionState
+
+    if os.path.exists(path) and not rebuild:
+        with sqlite3.connect(path) as conn:
+            existing = conn.execute('SELECT count(*) FROM post').fetchone()[0]
+        if existing == rows:
+            print(f'Reusing {path} ({rows} posts)', file=sys.stderr)
+            return
+    if os.path.exists(path):
+        os.remove(path)
+
+    synthetic_db = peewee.SqliteDatabase(path)
+    with synthetic_db.bind_ctx([Post, SubscriptionState]):
+        synthetic_db.create_tables([Post, SubscriptionState])
+    synthetic_db.close()
+
+    db_bulk.import_table(path, 'post', _synthetic_rows(rows, days, authors), 'jsonl')
+
+
+def deep_cursors(db_path: str, count: int) -> List[str]:
+    """Cursors pointing at random moments in the feed's history."""
+    with sqlite3.connect(f'file:{db_path}?mode=ro', uri=True) as conn:
+        oldest, newest = conn.execute('SELECT min(indexed_at), max(indexed_at) FROM post').fetchone()
+    if oldest is None:
+        return []
+
+    oldest_ms = datetime.fromisoformat(oldest).timestamp() * 1000
+    newest_ms = datetime.fromisoformat(newest).timestamp() * 1000
+    # same format whats_alf.handler returns; 'bafz' sorts after every cid so no post at that instant is skipped
+    return [f'{int(random.uniform(oldest_ms, newest_ms))}::bafz' for _ in range(count)]
+
+
+def start_server(kind: str, db_path: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        'FEED_DATABASE_PATH': os.path.abspath(db_path),
+        'INGEST_BACKEND': 'none',
+        'REFRESH_LOG_PATH': os.devnull,
+    })
+    env.setdefault('HOSTNAME', 'localhost')
+    env.setdefault('WHATS_ALF_URI', DEFAULT_FEED)
+
+    if kind == 'flask':
+        command = [sys.executable, '-m', 'flask', '--app', 'server.app', 'run', '--port', str(port)]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'server.asgi:app', '--port', str(port), '--log-level', 'warning']
+    log_path = f'{db_path}.server.log'
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'{kind} server exited with code {process.returncode}, see {log_path}')
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/readyz', timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+
+    process.terminate()
+    raise SystemExit(f'{kind} server did not become ready')
+
+
+async def _replay_session(client: httpx.AsyncClient, feed: str, session: Session, start: float,
+                          min_pages: int, cursor: Optional[str], results: list) -> None:
+    pages = list(session)
+    while len(pages) < min_pages and pages[-1][1] > 1:
+        pages.append((pages[-1][0], pages[-1][1]))  # scroll on as soon as the previous page arrives
+
+    ready_at = 0.0
+    for depth, (offset, limit) in enumerate(pages):
+        scheduled = max(start + offset, ready_at)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        params = {'feed': feed, 'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
+        try:
+            response = await client.get(SKELETON_PATH, params=params)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        ready_at = time.perf_counter()
+        results.append((ready_at - scheduled, limit, depth, status))
+
+        if response is None or status != 200:
+            return
+        cursor = response.json().get('cursor')
+        if not cursor or cursor == CURSOR_EOF:
+            return
+
+
+async def replay(url: str, feed: str, sessions: List[Session], min_pages: int, cursors: List[Optional[str]],
+                 connections: int) -> Tuple[list, float]:
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    results = []
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        start = time.perf_counter() + 0.5
+        await asyncio.gather(*(
+            _replay_session(client, feed, session, start, min_pages, cursor, results)
+            for session, cursor in zip(sessions, cursors)
+        ))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def _percentile(values: list, percentile: float) -> float:
+    # 'inclusive' interpolates between observed values; the default extrapolates past them on small samples
+    return statistics.quantiles(values, n=100, method='inclusive')[int(percentile) - 1] if len(values) > 1 else values[0]
+
+
+def _summary(latencies: list) -> str:
+    return '  '.join(f'p{p} {_percentile(latencies, p) * 1000:8.2f} ms' for p in (50, 95, 99))
+
+
+def report(results: list, elapsed: float, offered: int) -> None:
+    ok = [latency for latency, _, _, status in results if status == 200]
+    errors = defaultdict(int)
+    for _, _, _, status in results:
+        if status != 200:
+            errors[status] += 1
+
+    print(f'{len(results)} requests ({offered} log entries plus followed cursors) in {elapsed:.1f}s, '
+          f'{len(results) / elapsed:.1f} req/s, errors: {dict(errors) or 0}')
+    if not ok:
+        return
+    print(f'all           {_summary(ok)}')
+
+    groups = defaultdict(list)
+    for latency, limit, depth, status in results:
+        if status == 200:
+            groups[f'limit={limit}'].append(latency)
+            groups['first page' if depth == 0 else 'later pages'].append(latency)
+    for name in sorted(groups):
+        print(f'{name:<13} {_summary(groups[name])}  (n={len(groups[name])})')
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', default='refresh_logs.csv', help='refresh log to replay')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='only replay log entries from this time on')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed (1 = real time)')
+    parser.add_argument('--max-gap', type=float, default=None, help='cap idle gaps in the log at this many seconds')
+    parser.add_argument('--max-requests', type=int, default=None, help='stop after this many log entries')
+    parser.add_argument('--session-gap', type=float, default=30.0,
+                        help='page loads closer than this (log seconds) follow the previous cursor')
+    parser.add_argument('--min-pages', type=int, default=1, help='scroll every page-load session at least this deep')
+    parser.add_argument('--deep-fraction', type=float, default=0.0,
+                        help='share of sessions starting from a random point in the feed (needs --db)')
+    parser.add_argument('--connections', type=int, default=100)
+
+    target = parser.add_argument_group('target')
+    target.add_argument('--url', help='existing server to test (default: start one on --db)')
+    target.add_argument('--feed', default=os.environ.get('WHATS_ALF_URI', DEFAULT_FEED))
+    target.add_argument('--server', choices=['asgi', 'flask'], default='asgi', help='server to start on --db')
+    target.add_argument('--port', type=int, default=8765)
+
+    synthetic = parser.add_argument_group('synthetic database')
+    synthetic.add_argument('--db', default='loadtest_feed.db')
+    synthetic.add_argument('--rows', type=int, default=None, help='build --db with this many Post rows')
+    synthetic.add_argument('--days', type=int, default=365, help='history the synthetic posts are spread over')
+    synthetic.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args(argv)
+
+    records = load_log(args.log, args.since)[:args.max_requests]
+    sessions = build_sessions(records, args.speed, args.max_gap, args.session_gap)
+    print(f'{len(records)} log entries -> {len(sessions)} sessions, '
+          f'replay length {sessions[-1][-1][0] if sessions else 0:.0f}s at {args.speed:g}x', file=sys.stderr)
+
+    if args.rows is not None:
+        build_synthetic_db(args.db, args.rows, args.days, rebuild=args.rebuild)
+
+    cursors: List[Optional[str]] = [None] * len(sessions)
+    if args.deep_fraction > 0:
+        deep = iter(deep_cursors(args.db, len(sessions)))
+        # only page loads start mid-feed; limit=1 polls always look at the top
+        cursors = [
+            next(deep) if session[0][1] > 1 and random.random() < args.deep_fraction else None
+            for session in sessions
+        ]
+
+    server = None
+    url = args.url
+    if url is None:
+        # make `kill` go through the finally below so the server is not left behind
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+        server = start_server(args.server, args.db, args.port)
+        url = f'http://127.0.0.1:{args.port}'
+    try:
+        results, elapsed = asyncio.run(replay(url, args.feed, sessions, args.min_pages, cursors, args.connections))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report(results, elapsed, len(records))
+
+
+if __name__ == '__main__':
+    main()
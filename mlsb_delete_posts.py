@@ -3,7 +3,7 @@ import re
 import csv
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import peewee
 import streamlit as st
@@ -14,6 +14,8 @@ from atproto import Client
 ###############################################################################
 DB_PATH = os.getenv("FEED_DB_PATH", "feed_database2.db")          # Bluesky desktop feed DB
 LOG_PATH = os.getenv("DELETED_TSV_PATH", "deleted_posts.tsv")     # where deletions are logged
+ADDED_LOG_PATH = os.getenv("ADDED_TSV_PATH", "added_posts.tsv")   # where manual additions are logged (server.refilter keeps these)
+GET_POSTS_BATCH = 25                                               # app.bsky.feed.getPosts max URIs per call
 
 ###############################################################################
 # Database models                                                              
@@ -42,8 +44,13 @@ class Post(BaseModel):
 # Helpers                                                                      
 ###############################################################################
 
+@st.cache_resource(show_spinner=False)
 def get_client() -> Client:
-    """Return a logged‑in atproto.Client instance."""
+    """Return a logged‑in atproto.Client instance.
+
+    Cached for the lifetime of the Streamlit server, so every button press
+    reuses one session (the client refreshes its own tokens) instead of
+    hitting createSession again."""
     client = Client()
     handle = st.secrets.get("bsky_handle", os.getenv("BSKY_HANDLE"))
     app_pass = st.secrets.get("bsky_app_password", os.getenv("BSKY_APP_PASS"))
@@ -62,6 +69,45 @@ def convert_web_url_to_at_uri(web_url: str) -> Optional[str]:
         return f"at://{handle}/app.bsky.feed.post/{post_id}"
     return None
 
+
+def extract_web_urls(text: str) -> List[str]:
+    """Pull every Bluesky post URL out of pasted text or an uploaded file, de‑duplicated in order."""
+    urls = re.findall(r"https://bsky\.app/profile/[^/\s]+/post/[^/\s?#]+", text)
+    return list(dict.fromkeys(urls))
+
+
+def fetch_posts(client: Client, web_urls: Iterable[str]) -> Tuple[Dict[str, dict], List[str]]:
+    """Resolve many post URLs with batched getPosts calls.
+
+    Returns ``(found, missing)`` where *found* maps each web URL to its
+    ``{"cid", "did", "text"}`` and *missing* lists URLs that were invalid
+    or not returned by the AppView."""
+    wanted = {}  # at‑uri (handle or DID based) → web url
+    missing = []
+    for web_url in web_urls:
+        at_uri = convert_web_url_to_at_uri(web_url)
+        if at_uri is None:
+            missing.append(web_url)
+        else:
+            wanted[at_uri] = web_url
+
+    found = {}
+    at_uris = list(wanted)
+    for start in range(0, len(at_uris), GET_POSTS_BATCH):
+        batch = at_uris[start:start + GET_POSTS_BATCH]
+        resp = client.get_posts(uris=batch)
+        for post in resp.posts:
+            # Returned URIs are DID based; match on author handle or DID plus record key
+            post_id = post.uri.split("/")[-1]
+            for key in (post.author.handle, post.author.did):
+                web_url = wanted.get(f"at://{key}/app.bsky.feed.post/{post_id}")
+                if web_url:
+                    found[web_url] = {"cid": post.cid, "did": post.author.did, "text": post.record.text}
+                    break
+
+    missing.extend(url for url in wanted.values() if url not in found)
+    return found, missing
+
 # --------------------------------------------------------------------------- #
 # Deletion helpers                                                             #
 # --------------------------------------------------------------------------- #
@@ -72,21 +118,55 @@ def delete_post_by_cid(post_cid: str) -> int:
         return Post.delete().where(Post.cid == post_cid).execute()
 
 
+def delete_posts_by_cids(post_cids: Iterable[str]) -> set:
+    """Delete all rows matching *post_cids* in one transaction. Returns the CIDs that were present."""
+    post_cids = list(post_cids)
+    if not post_cids:
+        return set()
+
+    with db.connection_context(), db.atomic():
+        present = {row.cid for row in Post.select(Post.cid).where(Post.cid.in_(post_cids))}
+        if present:
+            Post.delete().where(Post.cid.in_(list(present))).execute()
+    return present
+
+
 def log_deletion(web_url: str, cid: str, did: str, text: str) -> None:
     """Append tab‑separated deletion record (timestamp | url | cid | did | text)."""
-    row = {
-        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
-        "web_url": web_url,
-        "cid": cid,
-        "did": did,
-        "text": text.replace("\t", " ").replace("\n", " "),
-    }
-    file_exists = Path(LOG_PATH).exists()
-    with open(LOG_PATH, "a", newline="", encoding="utf‑8") as fh:
-        writer = csv.DictWriter(fh, fieldnames=row.keys(), delimiter="\t")
+    log_deletions([(web_url, cid, did, text)])
+
+
+def log_deletions(records: Iterable[Tuple[str, str, str, str]]) -> None:
+    """Append many (url, cid, did, text) deletion records to the TSV in a single write."""
+    _append_log(LOG_PATH, records)
+
+
+def log_addition(web_url: str, cid: str, did: str, text: str) -> None:
+    """Append tab‑separated addition record (same columns as the deletion log)."""
+    _append_log(ADDED_LOG_PATH, [(web_url, cid, did, text)])
+
+
+def _append_log(path: str, records: Iterable[Tuple[str, str, str, str]]) -> None:
+    timestamp = datetime.utcnow().isoformat(timespec="seconds")
+    rows = [
+        {
+            "timestamp": timestamp,
+            "web_url": web_url,
+            "cid": cid,
+            "did": did,
+            "text": text.replace("\t", " ").replace("\n", " "),
+        }
+        for web_url, cid, did, text in records
+    ]
+    if not rows:
+        return
+
+    file_exists = Path(path).exists()
+    with open(path, "a", newline="", encoding="utf‑8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=rows[0].keys(), delimiter="\t")
         if not file_exists:
             writer.writeheader()
-        writer.writerow(row)
+        writer.writerows(rows)
 
 # --------------------------------------------------------------------------- #
 # Addition helpers                                                             #
@@ -132,6 +212,8 @@ def add_post_to_db(web_url: str) -> str:
             reply_root=reply_root,
             indexed_at=created_at,
         )
+    # record the manual addition so a later re-filter doesn't remove it again
+    log_addition(web_url, cid, post.author.did, post.record.text)
     return "Post successfully added to database."
 
 ###############################################################################
@@ -173,6 +255,43 @@ if st.button("Remove", key="remove_btn", type="primary"):
 
 st.divider()
 
+# ------------------------- Bulk deletion section ---------------------------- #
+st.subheader("Bulk remove posts (spam waves)")
+bulk_text = st.text_area("Paste post URLs (any separator)", key="bulk_urls", height=150)
+bulk_file = st.file_uploader("…or upload a file containing URLs", type=["txt", "csv", "tsv"], key="bulk_file")
+if st.button("Remove all", key="bulk_remove_btn", type="primary"):
+    source = bulk_text
+    if bulk_file is not None:
+        source += "\n" + bulk_file.getvalue().decode("utf-8", errors="ignore")
+
+    web_urls = extract_web_urls(source)
+    if not web_urls:
+        st.warning("No Bluesky post URLs found.")
+        st.stop()
+
+    try:
+        with st.spinner(f"Resolving {len(web_urls)} post(s)…"):
+            found, missing = fetch_posts(get_client(), web_urls)
+    except Exception as exc:
+        st.error(f"Could not fetch posts → {exc}")
+        st.stop()
+
+    deleted_cids = delete_posts_by_cids(info["cid"] for info in found.values())
+    log_deletions(
+        (web_url, info["cid"], info["did"], info["text"])
+        for web_url, info in found.items()
+        if info["cid"] in deleted_cids
+    )
+
+    st.success(f"Deleted {len(deleted_cids)} of {len(web_urls)} post(s). Logged to {LOG_PATH}.")
+    not_in_db = [url for url, info in found.items() if info["cid"] not in deleted_cids]
+    if not_in_db:
+        st.info(f"{len(not_in_db)} post(s) were not in the database:\n\n" + "\n".join(not_in_db))
+    if missing:
+        st.warning(f"{len(missing)} URL(s) could not be resolved:\n\n" + "\n".join(missing))
+
+st.divider()
+
 # ---------------------------- Addition section ------------------------------ #
 st.subheader("Add a post back (or any new post) to your local DB")
 add_url = st.text_input("URL to add", key="add_url")
@@ -190,5 +309,5 @@ if st.button("Add", key="add_btn", type="secondary"):
         st.error(result_msg)
 
 st.caption(
-    "Built with Streamlit · atproto · peewee · 🐍  |  Deletions logged to TSV; additions written straight to SQLite feed DB."
+    "Built with Streamlit · atproto · peewee · 🐍  |  Deletions and additions logged to TSV."
 )
\ No newline at end of file
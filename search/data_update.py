@@ -3,6 +3,8 @@
 import time
 from feed_database2 import Post, db
 from new_database import PostContent, new_db
+from facets import index_post
+from semantic import update_index
 
 from atproto import Client
 from atproto_client.exceptions import RequestException
@@ -94,12 +96,17 @@ def update_new_posts():
                 # Fetch real text from Bluesky
                 content_text = fetch_post_content_from_bluesky(post.uri, client)
 
-                # Create a new record with all the fields we want
-                PostContent.create(
-                    cid=post.cid,
-                    uri=post.uri,
-                    username=handle,
-                    content_text=content_text
-                )
+                # Create the record and its facet rows together, so a crash can't leave it unindexed
+                with new_db.atomic():
+                    post_content = PostContent.create(
+                        cid=post.cid,
+                        uri=post.uri,
+                        username=handle,
+                        content_text=content_text
+                    )
+                    index_post(post_content)
                 print(f"Added new post #{p_count} content for CID: {post.cid}")
-                p_count += 1
\ No newline at end of file
+                p_count += 1
+
+    # Append the new posts to the local semantic index (no-op until `python semantic.py fit` has run)
+    print(f"Embedded {update_index()} new post(s) into the semantic index.")
\ No newline at end of file
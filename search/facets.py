@@ -0,0 +1,144 @@
+# facets.py
+
+import os
+import re
+import sys
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from new_database import FacetCount, PostContent, PostFacet, PostTopic, new_db
+
+# The search scripts run from search/; the TID decoder is shared with the feed server
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from server.tid import tid_to_datetime
+
+PAGE_SIZE = 50
+
+# Topic facets: a post gets every topic whose pattern matches its text
+TOPIC_PATTERNS = {
+    'Structure prediction': re.compile(r'(?i)alphafold|\bAF[23]\b|rosettafold|esmfold|boltz|chai-1|structure prediction|cofolding|co-folding'),
+    'Protein design': re.compile(r'(?i)protein design|rfdiffusion|proteinmpnn|inverse folding|binder design|de novo'),
+    'Language models': re.compile(r'(?i)language model|\bpLMs?\b|\bESM\d*\b|\bLLMs?\b|transformer'),
+    'Generative models': re.compile(r'(?i)diffusion|flow matching|flow-matching|generative model|\bVAE\b'),
+    'Docking & ligands': re.compile(r'(?i)\bdock(ing|ed)?\b|ligand|small molecule|binding affinity|virtual screening'),
+    'Molecular dynamics': re.compile(r'(?i)molecular dynamic|\bMD simulation|conformation'),
+    'Drug discovery': re.compile(r'(?i)drug discovery|drug design|therapeutic'),
+    'RNA': re.compile(r'(?i)\bRNA\b'),
+    'Cryo-EM': re.compile(r'(?i)cryo-?em|cryo-?et'),
+    'Conferences & jobs': re.compile(r'(?i)neurips|icml|iclr|workshop|\bMLSB\b|hiring|phd position|postdoc'),
+}
+
+
+def facets_for(post: PostContent) -> Tuple[Optional[str], str, List[str]]:
+    """(author, month, topics) for a stored post."""
+    parts = (post.uri or '').replace('at://', '', 1).split('/')
+    author = parts[0] if parts and parts[0] else post.username
+
+    posted_at = tid_to_datetime(parts[2]) if len(parts) >= 3 else None
+    posted_at = posted_at or post.created_at or datetime.utcnow()
+    month = posted_at.strftime('%Y-%m')
+
+    text = post.content_text or ''
+    topics = [topic for topic, pattern in TOPIC_PATTERNS.items() if pattern.search(text)]
+    return author, month, topics
+
+
+def _increment(facet: str, values: List[str], amount: int = 1) -> None:
+    for value in values:
+        (FacetCount
+         .insert(facet=facet, value=value, count=amount)
+         .on_conflict(
+             conflict_target=[FacetCount.facet, FacetCount.value],
+             update={FacetCount.count: FacetCount.count + amount})
+         .execute())
+
+
+def index_post(post: PostContent) -> None:
+    """Add a newly stored post to the facet tables and bump the facet counts."""
+    author, month, topics = facets_for(post)
+    with new_db.atomic():
+        # query.execute() returns the last rowid even when the insert was ignored, so check the cursor's rowcount
+        cursor = new_db.execute(
+            PostFacet.insert(cid=post.cid, author=author or '', month=month).on_conflict_ignore()
+        )
+        if cursor.rowcount < 1:
+            return  # already indexed
+
+        if topics:
+            PostTopic.insert_many(
+                [{'cid': post.cid, 'topic': topic, 'month': month} for topic in topics]
+            ).on_conflict_ignore().execute()
+
+        _increment('author', [author or ''])
+        _increment('month', [month])
+        _increment('topic', topics)
+
+
+def rebuild_facets() -> int:
+    """Recompute all facet tables from PostContent (one-off backfill)."""
+    with new_db.connection_context():
+        with new_db.atomic():
+            PostTopic.delete().execute()
+            PostFacet.delete().execute()
+            FacetCount.delete().execute()
+
+            count = 0
+            for post in PostContent.select().iterator():
+                index_post(post)
+                count += 1
+    return count
+
+
+def facet_counts(facet: str, limit: Optional[int] = None, values: Optional[List[str]] = None) -> List[Tuple[str, int]]:
+    """Precomputed (value, count) pairs for a facet, most common first (months newest first)."""
+    query = FacetCount.select(FacetCount.value, FacetCount.count).where(FacetCount.facet == facet)
+    if values is not None:
+        query = query.where(FacetCount.value.in_(values))
+    if facet == 'month':
+        query = query.order_by(FacetCount.value.desc())
+    else:
+        query = query.order_by(FacetCount.count.desc(), FacetCount.value)
+    if limit:
+        query = query.limit(limit)
+    return [(row.value, row.count) for row in query]
+
+
+def search_posts(
+    query: str = '',
+    author: Optional[str] = None,
+    month: Optional[str] = None,
+    topic: Optional[str] = None,
+    page: int = 0,
+    page_size: int = PAGE_SIZE,
+) -> Tuple[List[PostContent], int]:
+    """
+    Return one page of matching posts (newest first) and the total match count.
+    Facet filters are answered from the covering indexes on PostFacet/PostTopic;
+    only the page's rows are read from PostContent.
+    """
+    if topic:
+        source = PostTopic
+        ids = PostTopic.select(PostTopic.cid).where(PostTopic.topic == topic)
+        if author:
+            ids = ids.join(PostFacet, on=(PostFacet.cid == PostTopic.cid)).where(PostFacet.author == author)
+    else:
+        source = PostFacet
+        ids = PostFacet.select(PostFacet.cid)
+        if author:
+            ids = ids.where(PostFacet.author == author)
+
+    if month:
+        ids = ids.where(source.month == month)
+    if query:
+        ids = (ids.join(PostContent, on=(PostContent.cid == source.cid))
+               .where(PostContent.content_text.contains(query)))
+
+    total = ids.count()
+    cids = [row.cid for row in ids.order_by(source.month.desc(), source.cid.desc()).paginate(page + 1, page_size)]
+
+    posts = {post.cid: post for post in PostContent.select().where(PostContent.cid.in_(cids))}
+    return [posts[cid] for cid in cids if cid in posts], total
+
+
+if __name__ == '__main__':
+    print(f"Indexed {rebuild_facets()} posts into facet tables.")
@@ -3,11 +3,19 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import os
 import peewee
 from datetime import datetime
 
 # Database configuration
-db = peewee.SqliteDatabase('../feed_database2.db')
+# Prefer the read-only snapshot published by server/snapshot.py, so lookups
+# here never take locks on the file the firehose is writing to.
+SNAPSHOT_PATH = os.environ.get('FEED_SNAPSHOT_PATH', '../snapshots/feed_database2.db')
+READ_ONLY = os.path.exists(SNAPSHOT_PATH)
+if READ_ONLY:
+    db = peewee.SqliteDatabase(f'file:{SNAPSHOT_PATH}?mode=ro', uri=True)
+else:
+    db = peewee.SqliteDatabase('../feed_database2.db')
 
 class BaseModel(peewee.Model):
     class Meta:
@@ -47,5 +55,6 @@ def check_feed_for_cid(target_cid: str, limit: int = 150) -> None:
             db.close()
 
 # Initialize DB and create tables if they don't exist yet
-with db.connection_context():
-    db.create_tables([Post])
\ No newline at end of file
+if not READ_ONLY:
+    with db.connection_context():
+        db.create_tables([Post])
\ No newline at end of file
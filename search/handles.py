@@ -0,0 +1,168 @@
+# handles.py
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import peewee
+from atproto import Client
+
+# DID -> handle resolution with a persistent local cache.
+#
+# PostContent.username holds the DID parsed from the at:// URI. Display code
+# calls HandleResolver.lookup(), which only reads the local cache and queues
+# unknown or stale DIDs; a background thread resolves the queue with batched
+# app.bsky.actor.getProfiles calls (25 actors per call) and writes results
+# back. Nothing on the display path waits for the network. DIDs whose fetch
+# failed (e.g. the AppView is down) are not queued again until a per-DID retry
+# delay has passed, doubling from HANDLE_RETRY_SECONDS up to
+# HANDLE_RETRY_MAX_SECONDS.
+#
+# getProfiles is public, so no login is needed. Point APPVIEW_URL at a stub
+# XRPC server (e.g. http://127.0.0.1:8080/xrpc) to test offline.
+
+APPVIEW_URL = os.environ.get('APPVIEW_URL', 'https://public.api.bsky.app/xrpc')
+HANDLE_CACHE_PATH = os.environ.get('HANDLE_CACHE_PATH', 'handle_cache.db')
+HANDLE_TTL = timedelta(days=int(os.environ.get('HANDLE_TTL_DAYS', 7)))
+HANDLE_RETRY_SECONDS = float(os.environ.get('HANDLE_RETRY_SECONDS', 30))
+HANDLE_RETRY_MAX_SECONDS = float(os.environ.get('HANDLE_RETRY_MAX_SECONDS', 60 * 60))
+GET_PROFILES_BATCH = 25
+
+# Kept out of content_database.db so it stays writable when the search app
+# reads content from a read-only snapshot.
+handle_db = peewee.SqliteDatabase(HANDLE_CACHE_PATH, pragmas={'journal_mode': 'wal'})
+
+class HandleCache(peewee.Model):
+    did = peewee.CharField(primary_key=True)
+    handle = peewee.CharField(null=True, index=True)  # None if the account could not be resolved
+    fetched_at = peewee.DateTimeField(default=datetime.utcnow)
+
+    class Meta:
+        database = handle_db
+
+with handle_db.connection_context():
+    handle_db.create_tables([HandleCache])
+
+
+def fetch_handles(client: Client, dids: List[str]) -> Dict[str, Optional[str]]:
+    """Resolve *dids* with batched getProfiles calls. Unresolvable DIDs map to None."""
+    resolved = {did: None for did in dids}
+    for start in range(0, len(dids), GET_PROFILES_BATCH):
+        batch = dids[start:start + GET_PROFILES_BATCH]
+        response = client.get_profiles(actors=batch)
+        for profile in response.profiles:
+            resolved[profile.did] = profile.handle
+    return resolved
+
+
+def store_handles(resolved: Dict[str, Optional[str]]) -> None:
+    now = datetime.utcnow()
+    rows = [{'did': did, 'handle': handle, 'fetched_at': now} for did, handle in resolved.items()]
+    with handle_db.connection_context(), handle_db.atomic():
+        for start in range(0, len(rows), 500):
+            (HandleCache
+             .insert_many(rows[start:start + 500])
+             .on_conflict_replace()
+             .execute())
+
+
+class HandleResolver:
+    """Non-blocking DID -> handle lookups backed by HandleCache and a background refresher."""
+
+    def __init__(self, base_url: str = APPVIEW_URL, ttl: timedelta = HANDLE_TTL) -> None:
+        self.client = Client(base_url=base_url)
+        self.ttl = ttl
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._failures: Dict[str, List[float]] = {}  # did -> [failed attempts, monotonic time to retry at]
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._refresh_loop, name='handle-resolver', daemon=True)
+        self._thread.start()
+
+    def lookup_many(self, dids: Iterable[str]) -> Dict[str, str]:
+        """
+        Return {did: handle} from the cache right away, falling back to the DID
+        itself. Missing or expired entries are queued for background refresh.
+        """
+        dids = [did for did in set(dids) if did and did.startswith('did:')]
+        found = {}
+        stale_before = datetime.utcnow() - self.ttl
+        with handle_db.connection_context():
+            for start in range(0, len(dids), 500):
+                for row in HandleCache.select().where(HandleCache.did.in_(dids[start:start + 500])):
+                    found[row.did] = row
+        for did in dids:
+            row = found.get(did)
+            if row is None or row.fetched_at < stale_before:
+                self._enqueue(did)
+
+        return {did: (found[did].handle if did in found and found[did].handle else did) for did in dids}
+
+    def lookup(self, did: str) -> str:
+        return self.lookup_many([did]).get(did, did)
+
+    def dids_for_handle(self, text: str, limit: int = 20) -> List[str]:
+        """Cached DIDs whose handle contains *text* (for author search)."""
+        with handle_db.connection_context():
+            query = (HandleCache.select(HandleCache.did)
+                     .where(HandleCache.handle.contains(text.lstrip('@')))
+                     .limit(limit))
+            return [row.did for row in query]
+
+    def _enqueue(self, did: str) -> None:
+        with self._lock:
+            if did in self._queued:
+                return
+            failure = self._failures.get(did)
+            if failure is not None and time.monotonic() < failure[1]:
+                return
+            self._queued.add(did)
+        self._queue.put(did)
+
+    def _refresh_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # drain whatever else is waiting, up to one getProfiles call
+            while len(batch) < GET_PROFILES_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                store_handles(fetch_handles(self.client, batch))
+            except Exception as e:
+                print(f"Handle resolution failed for {len(batch)} DID(s): {e}")
+                self._backoff(batch)
+            else:
+                with self._lock:
+                    for did in batch:
+                        self._failures.pop(did, None)
+            finally:
+                with self._lock:
+                    self._queued.difference_update(batch)
+
+    def _backoff(self, dids: List[str]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for did in dids:
+                attempts = self._failures.get(did, [0, 0.0])[0] + 1
+                delay = min(HANDLE_RETRY_MAX_SECONDS, HANDLE_RETRY_SECONDS * 2 ** min(attempts - 1, 32))
+                self._failures[did] = [attempts, now + delay]
+
+
+def refresh_all(dids: Iterable[str], base_url: str = APPVIEW_URL) -> int:
+    """Synchronously resolve every DID in *dids* (bulk backfill). Returns the number resolved."""
+    resolved = fetch_handles(Client(base_url=base_url), sorted(set(dids)))
+    store_handles(resolved)
+    return sum(1 for handle in resolved.values() if handle)
+
+
+if __name__ == '__main__':
+    from new_database import PostContent, new_db
+
+    with new_db.connection_context():
+        dids = [row.username for row in PostContent.select(PostContent.username).distinct() if row.username]
+    print(f"Resolved {refresh_all(dids)} of {len(set(dids))} DIDs.")
@@ -1,5 +1,6 @@
 # new_database.py
 
+import os
 import peewee
 from datetime import datetime
 
@@ -16,6 +17,53 @@ class PostContent(BaseContentModel):
     content_text = peewee.TextField(null=True) # The text of the post
     created_at = peewee.DateTimeField(default=datetime.utcnow)
 
+# Facet tables, maintained incrementally by facets.index_post() on insert.
+# The composite indexes cover the filtered queries in facets.search_posts(),
+# so a facet click is an index range scan rather than a table scan.
+class PostFacet(BaseContentModel):
+    cid = peewee.CharField(unique=True)
+    author = peewee.CharField()                # DID parsed from the URI
+    month = peewee.CharField()                 # 'YYYY-MM' the post was made
+
+    class Meta:
+        indexes = (
+            (('author', 'month', 'cid'), False),
+            (('month', 'cid'), False),
+        )
+
+class PostTopic(BaseContentModel):
+    cid = peewee.CharField()
+    topic = peewee.CharField()
+    month = peewee.CharField()
+
+    class Meta:
+        indexes = (
+            (('topic', 'month', 'cid'), True),
+        )
+
+class FacetCount(BaseContentModel):
+    facet = peewee.CharField()                 # 'author' | 'month' | 'topic'
+    value = peewee.CharField()
+    count = peewee.IntegerField(default=0)
+
+    class Meta:
+        primary_key = peewee.CompositeKey('facet', 'value')
+
 # Initialize DB and create tables if they don't exist yet
 with new_db.connection_context():
-    new_db.create_tables([PostContent])
+    new_db.create_tables([PostContent, PostFacet, PostTopic, FacetCount])
+
+# Read-only snapshot published by server/snapshot.py
+CONTENT_SNAPSHOT_PATH = os.environ.get('CONTENT_SNAPSHOT_PATH', '../snapshots/content_database.db')
+
+def use_snapshot(path: str = CONTENT_SNAPSHOT_PATH) -> peewee.SqliteDatabase:
+    """
+    For read-only apps (search.py): bind all content models to the published
+    snapshot so queries never contend with writers. Returns the database to
+    open connections on (the live one if no snapshot exists yet).
+    """
+    if not os.path.exists(path):
+        return new_db
+    snapshot_db = peewee.SqliteDatabase(f'file:{path}?mode=ro', uri=True)
+    snapshot_db.bind([PostContent, PostFacet, PostTopic, FacetCount])
+    return snapshot_db
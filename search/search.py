@@ -1,9 +1,17 @@
 # streamlit_app.py
 
+import os
+
 import streamlit as st
-from new_database import PostContent, new_db
+from new_database import PostContent, use_snapshot
+from facets import PAGE_SIZE, facet_counts, search_posts
+from handles import HandleResolver
+import semantic
 import streamlit.components.v1 as components
 
+# Query the read-only snapshot when one has been published
+read_db = use_snapshot()
+
 def build_multi_post_embed(posts):
     """
     Takes a list of PostContent records and returns one big HTML string
@@ -13,6 +21,10 @@ def build_multi_post_embed(posts):
     # We will store all <bluesky-post> blocks in a list, then join them
     post_blocks = []
 
+    # username holds the author DID; show the cached handle instead (never blocks)
+    posts = list(posts)
+    handles = get_handle_resolver().lookup_many(post.username for post in posts)
+
     for post in posts:
         # Provide some fallback text (e.g. first 100 chars)
         fallback_text = (post.content_text or "")[:100]
@@ -24,7 +36,7 @@ def build_multi_post_embed(posts):
         <bluesky-post src="{post.uri}">
           <blockquote class="bluesky-post-fallback">
             <p>{fallback_text_escaped}</p>
-            <p>— {post.username or "Unknown User"}</p>
+            <p>— {handles.get(post.username, post.username) or "Unknown User"}</p>
           </blockquote>
         </bluesky-post>
         """
@@ -84,6 +96,54 @@ def build_multi_post_embed(posts):
     
     return full_html
 
+@st.cache_resource
+def get_handle_resolver():
+    """One DID -> handle resolver (and its background refresh thread) per server process."""
+    return HandleResolver()
+
+@st.cache_resource
+def get_semantic_index():
+    """
+    Open the memory-mapped semantic index once per server process.
+    Returns None if no model has been fitted yet (run `python semantic.py fit`).
+    """
+    try:
+        return semantic.SemanticIndex.open()
+    except FileNotFoundError:
+        return None
+
+def semantic_search(query):
+    """Top matches for *query* from the local LSA index, best first."""
+    index = get_semantic_index()
+    if index is None:
+        st.error("Semantic index not built yet. Run `python semantic.py fit` first.")
+        return []
+
+    # Pick up rows appended by data_update since the index was opened
+    if os.path.exists(semantic.VECTORS_PATH) and os.path.getsize(semantic.VECTORS_PATH) > len(index.ids) * 4 * index.dim:
+        get_semantic_index.clear()
+        index = get_semantic_index()
+
+    cids = [cid for cid, _ in index.search(query, k=PAGE_SIZE)]
+    posts = {post.cid: post for post in PostContent.select().where(PostContent.cid.in_(cids))}
+    return [posts[cid] for cid in cids if cid in posts]
+
+def facet_selectbox(label, counts, names=None):
+    """
+    Sidebar selectbox listing facet values with their counts.
+    *names* optionally maps values to display names (e.g. DID -> handle).
+    Returns the selected value, or None for "All".
+    """
+    options = [None] + [value for value, _ in counts]
+    labels = dict(counts)
+    names = names or {}
+    return st.sidebar.selectbox(
+        label,
+        options,
+        format_func=lambda value: "All" if value is None else f"{names.get(value, value)} ({labels[value]})",
+        key=f"facet_{label.lower()}",
+    )
+
 def main():
     # Some custom styling for your Streamlit page
     st.markdown(
@@ -112,18 +172,45 @@ def main():
     #     data_update.update_new_posts()
     #     st.success("Database updated with any new posts!")
 
+    # Facets in the sidebar; counts are precomputed on insert (see facets.py)
+    with read_db.connection_context():
+        resolver = get_handle_resolver()
+        author_query = st.sidebar.text_input("Find author by handle")
+        if author_query:
+            author_counts = facet_counts("author", values=resolver.dids_for_handle(author_query))
+        else:
+            author_counts = facet_counts("author", limit=500)
+        author_names = resolver.lookup_many(value for value, _ in author_counts)
+        author = facet_selectbox("Author", author_counts, names=author_names)
+        month = facet_selectbox("Month", facet_counts("month"))
+        topic = facet_selectbox("Topic", facet_counts("topic"))
+
     # Build a simple search form
     with st.form("search_form"):
         query = st.text_input("Search text:")
+        mode = st.radio("Mode", ["Keyword", "Semantic (offline)"], horizontal=True)
         submit_button = st.form_submit_button("Search")
 
     if submit_button:
-        with new_db.connection_context():
-            results = PostContent.select().where(PostContent.content_text.contains(query))
-            count = results.count()
-            st.write(f"Found {count} result(s).")
-
-            if count > 0:
+        st.session_state["query"] = query
+        st.session_state["mode"] = mode
+        st.session_state["page"] = 1
+    query = st.session_state.get("query", "")
+
+    if query and st.session_state.get("mode") == "Semantic (offline)":
+        st.caption("Semantic mode ranks by meaning and ignores the sidebar facets.")
+        with read_db.connection_context():
+            results = semantic_search(query)
+            st.write(f"Top {len(results)} semantic match(es).")
+            if results:
+                components.html(build_multi_post_embed(results), height=1800, scrolling=True)
+    elif query or author or month or topic:
+        page = st.sidebar.number_input("Page", min_value=1, step=1, key="page")
+        with read_db.connection_context():
+            results, count = search_posts(query, author=author, month=month, topic=topic, page=page - 1)
+            st.write(f"Found {count} result(s). Showing page {page} of {max(1, -(-count // PAGE_SIZE))}.")
+
+            if results:
                 # Generate a single HTML doc with all <bluesky-post> elements
                 multi_html = build_multi_post_embed(results)
 
@@ -0,0 +1,227 @@
+# semantic.py
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from new_database import PostContent, new_db
+
+# Offline semantic search: TF-IDF projected to a low-rank LSA space.
+#
+#   semantic_model.npz   vocabulary, idf and the (vocab x DIM) projection
+#   semantic_vectors.f32 raw float32 matrix, one L2-normalised row per post
+#   semantic_ids.tsv     "<PostContent.id>\t<cid>" for each row, same order
+#
+# The vector file is only ever appended to and is opened with np.memmap, so
+# opening the index is cheap and the OS pages rows in as queries touch them.
+#
+#   python semantic.py fit      # (re)fit the projection and rebuild the index
+#   python semantic.py update   # embed posts added since the last run
+
+MODEL_PATH = 'semantic_model.npz'
+VECTORS_PATH = 'semantic_vectors.f32'
+IDS_PATH = 'semantic_ids.tsv'
+
+DIM = 128
+MAX_VOCAB = 50000
+MIN_DF = 2
+
+_TOKEN = re.compile(r'[a-z0-9][a-z0-9\-]+')
+_URL = re.compile(r'https?://\S+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word unigrams and bigrams, with URLs removed."""
+    words = _TOKEN.findall(_URL.sub(' ', (text or '').lower()))
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+class _Sparse:
+    """Minimal COO matrix: just enough for randomized SVD without scipy."""
+
+    def __init__(self, rows: np.ndarray, cols: np.ndarray, values: np.ndarray, shape: Tuple[int, int]) -> None:
+        self.rows, self.cols, self.values, self.shape = rows, cols, values, shape
+
+    def dot(self, dense: np.ndarray) -> np.ndarray:
+        out = np.zeros((self.shape[0], dense.shape[1]), dtype=np.float32)
+        np.add.at(out, self.rows, self.values[:, None] * dense[self.cols])
+        return out
+
+    def tdot(self, dense: np.ndarray) -> np.ndarray:
+        out = np.zeros((self.shape[1], dense.shape[1]), dtype=np.float32)
+        np.add.at(out, self.cols, self.values[:, None] * dense[self.rows])
+        return out
+
+
+class SemanticModel:
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, projection: np.ndarray) -> None:
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.projection = projection
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> 'SemanticModel':
+        model = np.load(path)
+        vocabulary = {term: index for index, term in enumerate(json.loads(str(model['terms'])))}
+        return cls(vocabulary, model['idf'], model['projection'])
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez(path, terms=np.array(json.dumps(terms)), idf=self.idf, projection=self.projection)
+
+    def _tfidf(self, texts: Sequence[str]) -> _Sparse:
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            counts = Counter(self.vocabulary[t] for t in tokenize(text) if t in self.vocabulary)
+            if not counts:
+                continue
+            weights = np.array([(1 + math.log(c)) * self.idf[i] for i, c in counts.items()], dtype=np.float32)
+            weights /= np.linalg.norm(weights)
+            rows.extend([row] * len(counts))
+            cols.extend(counts.keys())
+            values.append(weights)
+
+        values = np.concatenate(values) if values else np.zeros(0, dtype=np.float32)
+        return _Sparse(np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), values,
+                       (len(texts), len(self.vocabulary)))
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """L2-normalised float32 embeddings, one row per text."""
+        vectors = self._tfidf(texts).dot(self.projection)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], dim: int = DIM, seed: int = 0) -> 'SemanticModel':
+        document_frequency = Counter()
+        for text in texts:
+            document_frequency.update(set(tokenize(text)))
+
+        terms = [t for t, df in document_frequency.most_common(MAX_VOCAB) if df >= MIN_DF]
+        vocabulary = {term: index for index, term in enumerate(terms)}
+        idf = np.array([math.log((1 + len(texts)) / (1 + document_frequency[t])) + 1 for t in terms], dtype=np.float32)
+
+        model = cls(vocabulary, idf, np.zeros((len(terms), 0), dtype=np.float32))
+        matrix = model._tfidf(texts)
+
+        # Randomized SVD (Halko et al.) using only sparse x dense products
+        rank = min(dim, len(terms), len(texts))
+        rng = np.random.default_rng(seed)
+        sample = matrix.dot(rng.standard_normal((len(terms), rank + 10)).astype(np.float32))
+        for _ in range(2):
+            sample, _ = np.linalg.qr(matrix.dot(matrix.tdot(np.linalg.qr(sample)[0])))
+        basis, _ = np.linalg.qr(sample)
+        _, _, vt = np.linalg.svd(matrix.tdot(basis).T, full_matrices=False)
+
+        model.projection = np.ascontiguousarray(vt[:rank].T, dtype=np.float32)
+        return model
+
+
+class SemanticIndex:
+    """Memory-mapped matrix of post embeddings with cosine top-k search."""
+
+    def __init__(self, model: SemanticModel, vectors_path: str = VECTORS_PATH, ids_path: str = IDS_PATH) -> None:
+        self.model = model
+        self.vectors_path = vectors_path
+        self.ids_path = ids_path
+        self.dim = model.projection.shape[1]
+
+        self.ids: List[Tuple[int, str]] = []
+        if os.path.exists(ids_path):
+            with open(ids_path, 'r') as fh:
+                for line in fh:
+                    post_id, cid = line.rstrip('\n').split('\t')
+                    self.ids.append((int(post_id), cid))
+
+        self.vectors = self._map()
+
+    @classmethod
+    def open(cls, model_path: str = MODEL_PATH) -> 'SemanticIndex':
+        return cls(SemanticModel.load(model_path))
+
+    def _map(self) -> Optional[np.ndarray]:
+        if not os.path.exists(self.vectors_path):
+            return None
+        rows = min(len(self.ids), os.path.getsize(self.vectors_path) // (4 * self.dim))
+        if rows == 0:
+            return None
+        # a crash between the two appends can leave extra rows; ignore them
+        self.ids = self.ids[:rows]
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+    @property
+    def last_post_id(self) -> int:
+        return self.ids[-1][0] if self.ids else 0
+
+    def append(self, posts: Sequence[PostContent]) -> int:
+        """Embed *posts* and append them to the vector and id files."""
+        if not posts:
+            return 0
+
+        vectors = self.model.embed([post.content_text or '' for post in posts]).astype(np.float32)
+        with open(self.vectors_path, 'r+b' if os.path.exists(self.vectors_path) else 'wb') as fh:
+            # truncate any partial/orphaned rows before appending
+            fh.truncate(len(self.ids) * 4 * self.dim)
+            fh.seek(0, os.SEEK_END)
+            fh.write(vectors.tobytes())
+        with open(self.ids_path, 'a') as fh:
+            fh.writelines(f'{post.id}\t{post.cid}\n' for post in posts)
+
+        self.ids.extend((post.id, post.cid) for post in posts)
+        self.vectors = self._map()
+        return len(posts)
+
+    def search(self, query: str, k: int = 50) -> List[Tuple[str, float]]:
+        """Top-*k* (cid, cosine similarity) pairs for *query*."""
+        if self.vectors is None:
+            return []
+
+        scores = self.vectors @ self.model.embed([query])[0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i][1], float(scores[i])) for i in top if scores[i] > 0]
+
+
+def update_index(batch_size: int = 1000) -> int:
+    """Embed PostContent rows added since the index was last updated."""
+    if not os.path.exists(MODEL_PATH):
+        return 0
+
+    index = SemanticIndex.open()
+    added = 0
+    with new_db.connection_context():
+        while True:
+            posts = list(PostContent.select()
+                         .where(PostContent.id > index.last_post_id)
+                         .order_by(PostContent.id)
+                         .limit(batch_size))
+            if not posts:
+                return added
+            added += index.append(posts)
+
+
+def fit_index() -> int:
+    """Fit the LSA projection on all stored posts and rebuild the index from scratch."""
+    with new_db.connection_context():
+        texts = [post.content_text or '' for post in PostContent.select(PostContent.content_text)]
+    SemanticModel.fit(texts).save(MODEL_PATH)
+
+    for path in (VECTORS_PATH, IDS_PATH):
+        if os.path.exists(path):
+            os.remove(path)
+    return update_index()
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'fit':
+        print(f"Fitted model and indexed {fit_index()} posts.")
+    else:
+        print(f"Indexed {update_index()} new posts.")
@@ -1,24 +1,45 @@
 import sys
-import csv
-from datetime import datetime
 import signal
 import threading
 
 from server import config
-from server import data_stream
+from server import health
+from server import metrics
+from server import profiling
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 
 from server.algos import algos
-from server.data_filter import operations_callback
+from server.logger import log_refresh, logger
 
 app = Flask(__name__)
 
+# the database is open once server.algos (-> server.database) has been imported
+health.mark_ready('database')
+
+
+def run_ingest(stream_stop_event):
+    # atproto and the relevance filter (regex compilation, config_users.json,
+    # classifier) are imported here, on the ingest thread, so the app can serve
+    # skeletons from the database while they load.
+    try:
+        from server.data_filter import operations_callback
+        if config.INGEST_BACKEND == 'jetstream':
+            from server.jetstream import run as stream_target
+        else:
+            from server.data_stream import run as stream_target
+    except Exception as e:
+        logger.error(f'Failed to load ingest: {e}')
+        raise
+    health.mark_ready('filter')
+
+    stream_target(config.SERVICE_DID, operations_callback, stream_stop_event)
+
+
 stream_stop_event = threading.Event()
-stream_thread = threading.Thread(
-    target=data_stream.run, args=(config.SERVICE_DID, operations_callback, stream_stop_event,)
-)
-stream_thread.start()
+stream_thread = threading.Thread(target=run_ingest, args=(stream_stop_event,), name='ingest')
+if config.INGEST_BACKEND != 'none':
+    stream_thread.start()
 
 
 def sigint_handler(*_):
@@ -30,11 +51,32 @@ def sigint_handler(*_):
 signal.signal(signal.SIGINT, sigint_handler)
 
 
+def sigusr1_handler(*_):
+    output = profiling.profiler.start()
+    if output:
+        print(f'Sampling profiler started, writing to {output}')
+
+
+if hasattr(signal, 'SIGUSR1'):
+    signal.signal(signal.SIGUSR1, sigusr1_handler)
+
+
 @app.route('/')
 def index():
     return 'ATProto Feed Generator powered by The AT Protocol SDK for Python (https://github.com/MarshalX/atproto).'
 
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    body = health.status()
+    return jsonify(body), 200 if body['ready'] else 503
+
+
 @app.route('/.well-known/did.json', methods=['GET'])
 def did_json():
     if not config.SERVICE_DID.endswith(config.HOSTNAME):
@@ -69,6 +111,17 @@ def describe_feed_generator():
 @app.route('/xrpc/app.bsky.feed.getFeedSkeleton', methods=['GET'])
 def get_feed_skeleton():
     feed = request.args.get('feed', default=None, type=str)
+    # keep label cardinality bounded to the feeds we actually serve
+    feed_label = feed if feed in algos else 'unsupported'
+
+    with metrics.FEED_SKELETON_SECONDS.time(feed_label):
+        response, status = _get_feed_skeleton(feed)
+
+    metrics.FEED_SKELETON_REQUESTS.inc(feed_label, str(status))
+    return response, status
+
+
+def _get_feed_skeleton(feed):
     algo = algos.get(feed)
     if not algo:
         return 'Unsupported algorithm', 400
@@ -86,15 +139,36 @@ def get_feed_skeleton():
         cursor = request.args.get('cursor', default=None, type=str)
         limit = request.args.get('limit', default=20, type=int)
         body = algo(cursor, limit)
-
-        try:
-            with open("/home/ruh/www/mlsb_feed_hosted/refresh_logs.csv", mode='a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([datetime.now().isoformat(), limit])
-        except IOError as e:
-            print(f"Failed to write to log file: {e}")
+        log_refresh(limit)
 
     except ValueError:
         return 'Malformed cursor', 400
 
-    return jsonify(body)
+    return jsonify(body), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+@app.route('/debug/stages', methods=['GET'])
+def debug_stages():
+    if not profiling.DEBUG_ENDPOINTS:
+        return 'Not Found', 404
+
+    return jsonify(profiling.stage_percentiles())
+
+
+@app.route('/debug/profile', methods=['POST'])
+def debug_profile():
+    if not profiling.DEBUG_ENDPOINTS:
+        return 'Not Found', 404
+
+    seconds = request.args.get('seconds', default=profiling.PROFILE_SECONDS, type=int)
+    seconds = min(max(seconds, profiling.MIN_PROFILE_SECONDS), profiling.MAX_PROFILE_SECONDS)
+    output = profiling.profiler.start(seconds=seconds)
+    if output is None:
+        return 'Profiler already running', 409
+
+    return jsonify({'output': output, 'seconds': seconds}), 202
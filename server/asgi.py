@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from server import config
+from server import health
+from server import metrics
+from server.algos import algos
+from server.logger import log_refresh, logger
+
+# Async serving path.
+#
+# A plain ASGI app (no framework) serving the same feed endpoints as
+# server.app, with the firehose consumed by atproto's async client on the same
+# event loop. Skeleton queries go to a small pool of SQLite reader threads and
+# ingest (commit parsing, CAR/record decoding, operations_callback) to one
+# dedicated writer thread. The one piece of ingest left on the loop is
+# atproto's own frame decoding in AsyncFirehoseSubscribeReposClient.start():
+# the DAG-CBOR header and body of every frame are decoded there before our
+# handler is called.
+#
+# Run with:
+#   uvicorn server.asgi:app --host 0.0.0.0 --port 8001
+#
+# atproto and the relevance filter are imported on the ingest thread after
+# startup, so skeletons are served from the database while they load.
+
+DB_READERS = int(os.environ.get('ASGI_DB_READERS', 4))
+
+_read_executor = ThreadPoolExecutor(max_workers=DB_READERS, thread_name_prefix='sqlite-read')
+_ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest')
+
+_stream_stop_event = None
+_stream_task = None
+
+health.mark_ready('database')
+
+
+def _int_arg(query: dict, name: str, default: int) -> int:
+    # same semantics as Flask's request.args.get(..., type=int)
+    try:
+        return int(query[name][0])
+    except (KeyError, IndexError, ValueError):
+        return default
+
+
+def _str_arg(query: dict, name: str):
+    values = query.get(name)
+    return values[0] if values else None
+
+
+def _json(body, status: int = 200):
+    return status, json.dumps(body).encode('utf-8'), b'application/json'
+
+
+def _text(body: str, status: int = 200, content_type: bytes = b'text/html; charset=utf-8'):
+    return status, body.encode('utf-8'), content_type
+
+
+async def index(_query: dict):
+    return _text('ATProto Feed Generator powered by The AT Protocol SDK for Python (https://github.com/MarshalX/atproto).')
+
+
+async def did_json(_query: dict):
+    if not config.SERVICE_DID.endswith(config.HOSTNAME):
+        return _text('', 404)
+
+    return _json({
+        '@context': ['https://www.w3.org/ns/did/v1'],
+        'id': config.SERVICE_DID,
+        'service': [
+            {
+                'id': '#bsky_fg',
+                'type': 'BskyFeedGenerator',
+                'serviceEndpoint': f'https://{config.HOSTNAME}'
+            }
+        ]
+    })
+
+
+async def describe_feed_generator(_query: dict):
+    feeds = [{'uri': uri} for uri in algos.keys()]
+    return _json({
+        'encoding': 'application/json',
+        'body': {
+            'did': config.SERVICE_DID,
+            'feeds': feeds
+        }
+    })
+
+
+def _run_algo(algo, cursor, limit):
+    body = algo(cursor, limit)
+    log_refresh(limit)
+    return body
+
+
+async def get_feed_skeleton(query: dict):
+    feed = _str_arg(query, 'feed')
+    feed_label = feed if feed in algos else 'unsupported'
+
+    start = time.perf_counter()
+    response = await _get_feed_skeleton(feed, query)
+    metrics.FEED_SKELETON_SECONDS.observe(time.perf_counter() - start, feed_label)
+    metrics.FEED_SKELETON_REQUESTS.inc(feed_label, str(response[0]))
+    return response
+
+
+async def _get_feed_skeleton(feed, query: dict):
+    algo = algos.get(feed)
+    if not algo:
+        return _text('Unsupported algorithm', 400)
+
+    cursor = _str_arg(query, 'cursor')
+    limit = _int_arg(query, 'limit', 20)
+    try:
+        body = await asyncio.get_running_loop().run_in_executor(_read_executor, _run_algo, algo, cursor, limit)
+    except ValueError:
+        return _text('Malformed cursor', 400)
+
+    return _json(body)
+
+
+async def metrics_endpoint(_query: dict):
+    return _text(metrics.render(), content_type=metrics.CONTENT_TYPE.encode('utf-8'))
+
+
+async def healthz(_query: dict):
+    return _json({'status': 'ok'})
+
+
+async def readyz(_query: dict):
+    body = health.status()
+    return _json(body, 200 if body['ready'] else 503)
+
+
+_ROUTES = {
+    '/': index,
+    '/.well-known/did.json': did_json,
+    '/xrpc/app.bsky.feed.describeFeedGenerator': describe_feed_generator,
+    '/xrpc/app.bsky.feed.getFeedSkeleton': get_feed_skeleton,
+    '/metrics': metrics_endpoint,
+    '/healthz': healthz,
+    '/readyz': readyz,
+}
+
+
+def _load_ingest():
+    from server.data_filter import operations_callback
+    if config.INGEST_BACKEND == 'jetstream':
+        from server.jetstream import run
+    else:
+        from server.data_stream import run_async as run
+    health.mark_ready('filter')
+    return operations_callback, run
+
+
+async def _run_ingest(stop_event: asyncio.Event) -> None:
+    try:
+        operations_callback, run = await asyncio.get_running_loop().run_in_executor(_ingest_executor, _load_ingest)
+    except Exception as e:
+        logger.error(f'Failed to load ingest: {e}')
+        return
+
+    if config.INGEST_BACKEND == 'jetstream':
+        # the Jetstream backend is synchronous; run it on its own thread beside the loop
+        thread_stop_event = threading.Event()
+        threading.Thread(
+            target=run, args=(config.SERVICE_DID, operations_callback, thread_stop_event), daemon=True
+        ).start()
+        await stop_event.wait()
+        thread_stop_event.set()
+        return
+
+    await run(config.SERVICE_DID, operations_callback, stop_event, _ingest_executor)
+
+
+async def _startup() -> None:
+    global _stream_stop_event, _stream_task
+
+    if config.INGEST_BACKEND == 'none':
+        return
+
+    # don't hold up lifespan startup: ingest loads and connects in the background
+    _stream_stop_event = asyncio.Event()
+    _stream_task = asyncio.create_task(_run_ingest(_stream_stop_event))
+
+
+async def _shutdown() -> None:
+    if _stream_stop_event is not None:
+        _stream_stop_event.set()
+    if _stream_task is None:
+        return
+
+    try:
+        await asyncio.wait_for(_stream_task, timeout=10)
+    except asyncio.TimeoutError:
+        _stream_task.cancel()
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await _startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await _shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    if scope['type'] != 'http':
+        return
+
+    handler = _ROUTES.get(scope['path'])
+    if handler is None:
+        status, body, content_type = _text('Not Found', 404)
+    elif scope['method'] not in ('GET', 'HEAD'):
+        status, body, content_type = _text('Method Not Allowed', 405)
+    else:
+        status, body, content_type = await handler(parse_qs(scope['query_string'].decode('latin-1')))
+
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body if scope['method'] != 'HEAD' else b''})
@@ -0,0 +1,173 @@
+import csv
+import re
+import sqlite3
+import time
+import zlib
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# Second-stage relevance classifier.
+#
+# A hashing vectorizer (word unigrams + bigrams, crc32 so features are stable
+# across processes) feeding a logistic-regression weight vector stored as a
+# NumPy array. It only scores posts that already passed the loosened regex
+# prefilter in data_filter, in micro-batches, so its cost is a few array ops per
+# batch rather than a model call per firehose event.
+#
+# Train offline:
+#   python -m server.classifier --content-db search/content_database.db \
+#       --feed-db feed_database2.db --deleted deleted_posts.tsv --out classifier.npz
+
+N_FEATURES = 1 << 18
+
+_TOKEN = re.compile(r'[a-z0-9][a-z0-9\-]+')
+_URL = re.compile(r'https?://\S+')
+
+Features = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _tokens(text: str) -> List[str]:
+    words = _TOKEN.findall(_URL.sub(' ', text.lower()))
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+def vectorize(texts: Sequence[str], n_features: int = N_FEATURES) -> Features:
+    """Hash *texts* into a CSR-like ``(indices, values, row_ids)`` triple with L2-normalised rows."""
+    indices, values, row_ids = [], [], []
+    for row, text in enumerate(texts):
+        counts = {}
+        for token in _tokens(text or ''):
+            h = zlib.crc32(token.encode('utf-8'))
+            index = h % n_features
+            # sign bit from the high half of the hash reduces collision bias
+            counts[index] = counts.get(index, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+
+        if not counts:
+            continue
+
+        row_values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        row_values /= np.linalg.norm(row_values) or 1.0
+        indices.append(np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)))
+        values.append(row_values)
+        row_ids.append(np.full(len(counts), row, dtype=np.int64))
+
+    if not indices:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, np.zeros(0, dtype=np.float32), empty
+
+    return np.concatenate(indices), np.concatenate(values), np.concatenate(row_ids)
+
+
+def _decision(features: Features, weights: np.ndarray, bias: float, n_rows: int) -> np.ndarray:
+    indices, values, row_ids = features
+    scores = np.full(n_rows, bias, dtype=np.float64)
+    np.add.at(scores, row_ids, values * weights[indices])
+    return scores
+
+
+class RelevanceClassifier:
+    def __init__(self, weights: np.ndarray, bias: float, threshold: float = 0.5) -> None:
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self.last_batch_seconds = 0.0
+
+    @classmethod
+    def load(cls, path: str, threshold: float = 0.5) -> 'RelevanceClassifier':
+        model = np.load(path)
+        return cls(model['weights'], float(model['bias']), threshold)
+
+    def save(self, path: str) -> None:
+        np.savez(path, weights=self.weights, bias=np.float64(self.bias))
+
+    def score(self, texts: Sequence[str]) -> np.ndarray:
+        """Probability of relevance for each text."""
+        start = time.perf_counter()
+        features = vectorize(texts, len(self.weights))
+        probabilities = 1.0 / (1.0 + np.exp(-_decision(features, self.weights, self.bias, len(texts))))
+        self.last_batch_seconds = time.perf_counter() - start
+        return probabilities
+
+    def predict(self, texts: Sequence[str]) -> np.ndarray:
+        return self.score(texts) >= self.threshold
+
+
+def train(
+    positives: Sequence[str],
+    negatives: Sequence[str],
+    n_features: int = N_FEATURES,
+    epochs: int = 300,
+    learning_rate: float = 2.0,
+    l2: float = 1e-4,
+) -> RelevanceClassifier:
+    """Fit a class-balanced logistic regression with full-batch gradient descent."""
+    texts = list(positives) + list(negatives)
+    labels = np.concatenate([np.ones(len(positives)), np.zeros(len(negatives))])
+    # balance classes: we have far more feed posts than moderated ones
+    sample_weights = np.where(labels == 1, len(texts) / (2 * max(len(positives), 1)), len(texts) / (2 * max(len(negatives), 1)))
+
+    features = vectorize(texts, n_features)
+    indices, values, row_ids = features
+    weights = np.zeros(n_features, dtype=np.float64)
+    bias = 0.0
+
+    for _ in range(epochs):
+        probabilities = 1.0 / (1.0 + np.exp(-_decision(features, weights, bias, len(texts))))
+        error = (probabilities - labels) * sample_weights / len(texts)
+
+        gradient = l2 * weights
+        np.add.at(gradient, indices, values * error[row_ids])
+        weights -= learning_rate * gradient
+        bias -= learning_rate * error.sum()
+
+    return RelevanceClassifier(weights.astype(np.float32), bias)
+
+
+def load_training_data(content_db: str, feed_db: str, deleted_tsv: str) -> Tuple[List[str], List[str]]:
+    """Positives: stored texts of posts still in the feed. Negatives: texts moderators deleted."""
+    with sqlite3.connect(f'file:{feed_db}?mode=ro', uri=True) as conn:
+        feed_cids = {row[0] for row in conn.execute('SELECT cid FROM post')}
+
+    with open(deleted_tsv, 'r', newline='', encoding='utf-8') as fh:
+        deleted = {row['cid']: row['text'] for row in csv.DictReader(fh, delimiter='\t') if row.get('text')}
+
+    positives = []
+    with sqlite3.connect(f'file:{content_db}?mode=ro', uri=True) as conn:
+        for cid, text in conn.execute('SELECT cid, content_text FROM postcontent'):
+            if cid in feed_cids and cid not in deleted and text and not text.startswith('Error:'):
+                positives.append(text)
+
+    return positives, list(deleted.values())
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train the second-stage relevance classifier.')
+    parser.add_argument('--content-db', default='search/content_database.db')
+    parser.add_argument('--feed-db', default='feed_database2.db')
+    parser.add_argument('--deleted', default='deleted_posts.tsv')
+    parser.add_argument('--out', default='classifier.npz')
+    parser.add_argument('--epochs', type=int, default=300)
+    args = parser.parse_args()
+
+    positives, negatives = load_training_data(args.content_db, args.feed_db, args.deleted)
+    print(f'Training on {len(positives)} positives, {len(negatives)} negatives')
+
+    start = time.perf_counter()
+    model = train(positives, negatives, epochs=args.epochs)
+    print(f'Trained in {time.perf_counter() - start:.1f}s')
+
+    predictions = model.predict(positives + negatives)
+    labels = np.concatenate([np.ones(len(positives), dtype=bool), np.zeros(len(negatives), dtype=bool)])
+    recall = predictions[labels].mean() if len(positives) else float('nan')
+    rejected = (~predictions[~labels]).mean() if len(negatives) else float('nan')
+    print(f'Training-set recall on feed posts: {recall:.3f}, rejection of deleted posts: {rejected:.3f}')
+
+    model.save(args.out)
+    print(f'Saved weights to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
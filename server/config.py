@@ -14,3 +14,10 @@ WHATS_ALF_URI = os.environ.get('WHATS_ALF_URI')
 if WHATS_ALF_URI is None:
     raise RuntimeError('Publish your feed first (run publish_feed.py) to obtain Feed URI. '
                        'Set this URI to "WHATS_ALF_URI" environment variable.')
+
+
+# Ingest source: "firehose" (CBOR subscribeRepos), "jetstream" (JSON, filtered server-side)
+# or "none" to only serve from the database (load tests, read replicas)
+INGEST_BACKEND = os.environ.get('INGEST_BACKEND', 'firehose')
+if INGEST_BACKEND not in ('firehose', 'jetstream', 'none'):
+    raise RuntimeError('"INGEST_BACKEND" must be one of "firehose", "jetstream" or "none".')
@@ -1,8 +1,16 @@
+import os
+import time
 from collections import defaultdict
+from datetime import datetime, timezone
+from typing import List
 
 from atproto import models
 
 import re
+from server import metrics
+from server import profiling
+from server import flood
+from server.dedup import DuplicateDetector
 from server.logger import logger
 from server.database import db, Post
 
@@ -31,6 +39,27 @@ BIOML_USER_DIDS = set(config.get('bioml_only_dids', []))
 
 EXCLUDE_DIDS = set(config.get('exclude_dids', []))
 
+# Near-duplicate detector, seeded from moderator deletions (deleted_posts.tsv)
+duplicate_detector = DuplicateDetector()
+
+# Per-author rate limit on posts added to the feed (FLOOD_* settings in server/flood.py)
+flood_control = flood.FloodControl()
+
+# Optional second-stage classifier (train with `python -m server.classifier`).
+# When enabled, posts passing the loosened prefilter are scored in micro-batches.
+CLASSIFIER_PATH = os.environ.get('CLASSIFIER_PATH')
+CLASSIFIER_THRESHOLD = float(os.environ.get('CLASSIFIER_THRESHOLD', 0.5))
+CLASSIFIER_BATCH_SIZE = int(os.environ.get('CLASSIFIER_BATCH_SIZE', 32))
+CLASSIFIER_MAX_DELAY = float(os.environ.get('CLASSIFIER_MAX_DELAY', 2.0))
+
+classifier = None
+if CLASSIFIER_PATH:
+    from server.classifier import RelevanceClassifier
+    classifier = RelevanceClassifier.load(CLASSIFIER_PATH, CLASSIFIER_THRESHOLD)
+
+_pending_candidates = []
+_pending_since = 0.0
+
 def is_relevant_post(text: str, author_did: str) -> bool:
     """
     Determines if a post is relevant based on user category and content.
@@ -68,17 +97,124 @@ def is_relevant_post(text: str, author_did: str) -> bool:
     return has_ml and has_bio
 
 
+def is_candidate_post(text: str, author_did: str) -> bool:
+    """
+    Loosened prefilter used in front of the classifier: a post only needs to
+    match one of the ML/BIO/RELEVANT patterns, the classifier decides the rest.
+    """
+    if author_did in EXCLUDE_DIDS:
+        return False
+
+    if EXCLUDED_PATTERN_2.search(text) or EXCLUDED_PATTERN.search(text):
+        return False
+
+    return bool(RELEVANT.search(text) or ML_PATTERN.search(text) or BIO_PATTERN.search(text))
+
+
+# Outcomes of the regex stage, see prefilter()
+ACCEPT, CANDIDATE, REJECT = 'accept', 'candidate', 'reject'
+
+
+def prefilter(text: str, author_did: str) -> str:
+    """
+    The regex stage of the relevance decision, shared by ingest and
+    server.refilter. Auto-include accounts are accepted outright; with a
+    classifier configured the loosened prefilter only picks CANDIDATEs for it
+    to score, otherwise is_relevant_post decides.
+    """
+    if author_did in AUTO_INCLUDE_DIDS and author_did not in EXCLUDE_DIDS:
+        return ACCEPT
+    if classifier is not None:
+        return CANDIDATE if is_candidate_post(text, author_did) else REJECT
+    return ACCEPT if is_relevant_post(text, author_did) else REJECT
+
+
+def relevance_decisions(texts: List[str], author_dids: List[str]) -> List[bool]:
+    """
+    The relevance decision for a batch of posts: prefilter(), then the
+    classifier on the candidates in one batch. Dedup and flood control are
+    not applied.
+    """
+    stages = [prefilter(text, author_did) for text, author_did in zip(texts, author_dids)]
+    decisions = [stage == ACCEPT for stage in stages]
+
+    candidates = [i for i, stage in enumerate(stages) if stage == CANDIDATE]
+    if candidates:
+        keep = classifier.predict([texts[i] for i in candidates])
+        for i, is_relevant in zip(candidates, keep):
+            decisions[i] = bool(is_relevant)
+    return decisions
+
+
+def _queue_for_classifier(created_post: dict) -> None:
+    global _pending_since
+    if not _pending_candidates:
+        _pending_since = time.monotonic()
+    _pending_candidates.append(created_post)
+
+
+def _drop_pending(uris: set) -> None:
+    """Forget queued candidates that were deleted before their batch was scored."""
+    if uris and _pending_candidates:
+        _pending_candidates[:] = [created_post for created_post in _pending_candidates if created_post['uri'] not in uris]
+
+
+def _classify_pending() -> list:
+    """Score queued candidates once a batch is full or the oldest has waited long enough."""
+    if not _pending_candidates:
+        return []
+    if len(_pending_candidates) < CLASSIFIER_BATCH_SIZE and time.monotonic() - _pending_since < CLASSIFIER_MAX_DELAY:
+        return []
+
+    batch = list(_pending_candidates)
+    with profiling.stage('classifier_batch'):
+        keep = classifier.predict([created_post['record'].text for created_post in batch])
+    # only dequeue once scored; if predict raises the batch is retried on the next callback
+    del _pending_candidates[:len(batch)]
+    metrics.CLASSIFIER_BATCH_SECONDS.observe(classifier.last_batch_seconds)
+    metrics.POSTS_REJECTED.inc('classifier', amount=int(len(batch) - keep.sum()))
+    logger.info(f'Classified batch of {len(batch)} in {classifier.last_batch_seconds * 1000:.2f} ms')
+
+    return [created_post for created_post, is_relevant in zip(batch, keep) if is_relevant]
+
+
+def user_class(author_did: str) -> str:
+    if author_did in AUTO_INCLUDE_DIDS:
+        return flood.AUTO_INCLUDE
+    if author_did in BIOML_USER_DIDS:
+        return flood.BIOML
+    return flood.GENERAL
+
+
+def _record_ingest_lag(created_at: str) -> None:
+    try:
+        created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return
+
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    metrics.INGEST_LAG_SECONDS.set((datetime.now(timezone.utc) - created).total_seconds())
+
+
 def operations_callback(ops: defaultdict) -> None:
+    with metrics.OPERATIONS_CALLBACK_SECONDS.time():
+        _operations_callback(ops)
+
+
+def _operations_callback(ops: defaultdict) -> None:
     # Here we can filter, process, run ML classification, etc.
     # After our feed alg we can save posts into our DB
     # Also, we should process deleted posts to remove them from our DB and keep it in sync
 
     # for example, let's create our custom feed that will contain all posts that contains alf related text
     try:
+        accepted = []
         posts_to_create = []
         for created_post in ops[models.ids.AppBskyFeedPost]['created']:
             author = created_post['author']
             record = created_post['record']
+            _record_ingest_lag(record.created_at)
 
             # print all texts just as demo that data stream works
             post_with_images = isinstance(record.embed, models.AppBskyEmbedImages.Main)
@@ -106,36 +242,67 @@ def operations_callback(ops: defaultdict) -> None:
             #     }
             #     posts_to_create.append(post_dict)
 
-            # Apply our custom filter
-            if is_relevant_post(record.text, author):
-                reply_root = reply_parent = None
-                if record.reply:
-                    reply_root = record.reply.root.uri
-                    reply_parent = record.reply.parent.uri
-
-                post_dict = {
-                    'uri': created_post['uri'],
-                    'cid': created_post['cid'],
-                    'reply_parent': reply_parent,
-                    'reply_root': reply_root,
-                }
-                logger.info(
-                    f'NEW Relevant POST '
-                    f'[CREATED_AT={record.created_at}]'
-                    f'[AUTHOR={author}]'
-                )
-                posts_to_create.append(post_dict)
+            # Apply our custom filter; with a classifier, candidates are queued and scored in batches
+            with profiling.stage('relevance_filter'):
+                stage = prefilter(record.text, author)
+            if stage == ACCEPT:
+                accepted.append(created_post)
+            elif stage == CANDIDATE:
+                _queue_for_classifier(created_post)
 
         posts_to_delete = ops[models.ids.AppBskyFeedPost]['deleted']
+        if classifier is not None:
+            _drop_pending({post['uri'] for post in posts_to_delete})
+            accepted.extend(_classify_pending())
+
+        for created_post in accepted:
+            author = created_post['author']
+            record = created_post['record']
+
+            if author not in AUTO_INCLUDE_DIDS:
+                with profiling.stage('dedup'):
+                    rejection = duplicate_detector.check(record.text)
+                if rejection:
+                    metrics.POSTS_REJECTED.inc(rejection)
+                    logger.info(f'Rejected post [{rejection}] [URI={created_post["uri"]}]')
+                    continue
+
+            # auto-include accounts are throttled too, just with a higher cap
+            if not flood_control.allow(author, user_class(author)):
+                metrics.POSTS_REJECTED.inc('throttled')
+                logger.info(f'Rejected post [throttled] [AUTHOR={author}] [URI={created_post["uri"]}]')
+                continue
+
+            reply_root = reply_parent = None
+            if record.reply:
+                reply_root = record.reply.root.uri
+                reply_parent = record.reply.parent.uri
+
+            post_dict = {
+                'uri': created_post['uri'],
+                'cid': created_post['cid'],
+                'reply_parent': reply_parent,
+                'reply_root': reply_root,
+            }
+            logger.info(
+                f'NEW Relevant POST '
+                f'[CREATED_AT={record.created_at}]'
+                f'[AUTHOR={author}]'
+            )
+            posts_to_create.append(post_dict)
+
         if posts_to_delete:
             post_uris_to_delete = [post['uri'] for post in posts_to_delete]
-            Post.delete().where(Post.uri.in_(post_uris_to_delete))
+            with profiling.stage('db_delete'):
+                deleted_count = Post.delete().where(Post.uri.in_(post_uris_to_delete)).execute()
+            metrics.POSTS_DELETED.inc(amount=deleted_count)
             # logger.info(f'Deleted from feed: {len(post_uris_to_delete)}')
 
         if posts_to_create:
-            with db.atomic():
+            with profiling.stage('db_commit'), db.atomic():
                 for post_dict in posts_to_create:
                     Post.create(**post_dict)
+            metrics.POSTS_ADDED.inc(amount=len(posts_to_create))
             logger.info(f'Added to feed: {len(posts_to_create)}')
     except Exception as e:
         logger.error(f"Exception in operations_callback: {e}")
@@ -1,11 +1,23 @@
+import asyncio
 from collections import defaultdict
 
 import time
-from atproto import AtUri, CAR, firehose_models, FirehoseSubscribeReposClient, models, parse_subscribe_repos_message
+from atproto import (
+    AsyncFirehoseSubscribeReposClient,
+    AtUri,
+    CAR,
+    firehose_models,
+    FirehoseSubscribeReposClient,
+    models,
+    parse_subscribe_repos_message,
+)
 from atproto.exceptions import FirehoseError
 
+from server import metrics
+from server import profiling
 from server.database import SubscriptionState
 from server.logger import logger
+from server.reconnect import ReconnectController
 
 _INTERESTED_RECORDS = {
     models.AppBskyFeedLike: models.ids.AppBskyFeedLike,
@@ -14,16 +26,38 @@ _INTERESTED_RECORDS = {
 }
 
 
+class _RaiseOnDisconnect:
+    """
+    atproto's clients retry dropped connections themselves (2**n backoff, no
+    circuit breaker) and never raise to the caller. They only wait out a delay
+    before a reconnect, so raising there hands the reconnect to run() and the
+    ReconnectController instead.
+    """
+
+    def _get_reconnection_delay(self) -> int:
+        raise FirehoseError('firehose connection lost')
+
+
+class _FirehoseClient(_RaiseOnDisconnect, FirehoseSubscribeReposClient):
+    pass
+
+
+class _AsyncFirehoseClient(_RaiseOnDisconnect, AsyncFirehoseSubscribeReposClient):
+    pass
+
+
 def _get_ops_by_type(commit: models.ComAtprotoSyncSubscribeRepos.Commit) -> defaultdict:
     operation_by_type = defaultdict(lambda: {'created': [], 'deleted': []})
 
-    car = CAR.from_bytes(commit.blocks)
+    with profiling.stage('car_decode'):
+        car = CAR.from_bytes(commit.blocks)
     for op in commit.ops:
         if op.action == 'update':
             # we are not interested in updates
             continue
 
         uri = AtUri.from_str(f'at://{commit.repo}/{op.path}')
+        metrics.FIREHOSE_EVENTS.inc(uri.collection)
 
         if op.action == 'create':
             if not op.cid:
@@ -35,7 +69,8 @@ def _get_ops_by_type(commit: models.ComAtprotoSyncSubscribeRepos.Commit) -> defa
             if not record_raw_data:
                 continue
 
-            record = models.get_or_create(record_raw_data, strict=False)
+            with profiling.stage('record_decode'):
+                record = models.get_or_create(record_raw_data, strict=False)
             for record_type, record_nsid in _INTERESTED_RECORDS.items():
                 if uri.collection == record_nsid and models.is_record_type(record, record_type):
                     operation_by_type[record_nsid]['created'].append({'record': record, **create_info})
@@ -47,36 +82,81 @@ def _get_ops_by_type(commit: models.ComAtprotoSyncSubscribeRepos.Commit) -> defa
     return operation_by_type
 
 
-def run(name, operations_callback, stream_stop_event=None):
-    while stream_stop_event is None or not stream_stop_event.is_set():
+def _is_stopped(stream_stop_event) -> bool:
+    return stream_stop_event is not None and stream_stop_event.is_set()
+
+
+def run(name, operations_callback, stream_stop_event=None, backend=None):
+    # backend lets other ingest sources (e.g. server.jetstream) reuse the reconnect loop;
+    # it is called as backend(name, operations_callback, stream_stop_event, controller)
+    backend = backend or _run
+    controller = ReconnectController()
+    while not _is_stopped(stream_stop_event):
+        controller.before_attempt()
         try:
-            _run(name, operations_callback, stream_stop_event)
+            backend(name, operations_callback, stream_stop_event, controller)
+            reason = 'closed'  # the server closed the stream cleanly
         except FirehoseError as e:
-            logger.error(f"FirehoseError encountered: {e}. Reconnecting in 5 seconds...")
-            time.sleep(5)  # Wait before attempting to reconnect
+            logger.error(f"FirehoseError encountered: {e}")
+            reason = 'firehose_error'
         except Exception as e:
-            logger.error(f"Unhandled exception in data_stream.run: {e}. Reconnecting in 5 seconds...")
-            time.sleep(5)  # Wait before attempting to reconnect
+            logger.error(f"Unhandled exception in data_stream.run: {e}")
+            reason = 'exception'
 
-def _run(name, operations_callback, stream_stop_event=None):
-    state = SubscriptionState.get_or_none(SubscriptionState.service == name)
+        if _is_stopped(stream_stop_event):
+            break
 
-    params = None
-    if state:
-        params = models.ComAtprotoSyncSubscribeRepos.Params(cursor=state.cursor)
+        delay = controller.failed(reason)
+        logger.error(f"Reconnecting in {delay:.1f} seconds ({reason}, circuit {controller.state})...")
+        if stream_stop_event is not None:
+            stream_stop_event.wait(delay)
+        else:
+            time.sleep(delay)
 
-    client = FirehoseSubscribeReposClient(params)
 
+def _connect_params(name, controller):
+    """(params, checkpointed cursor) to (re)connect with, creating the cursor row on first run."""
+    state = SubscriptionState.get_or_none(SubscriptionState.service == name)
     if not state:
         SubscriptionState.create(service=name, cursor=0)
 
+    checkpoint = state.cursor if state else None
+    cursor = controller.resume_cursor(checkpoint)
+    params = models.ComAtprotoSyncSubscribeRepos.Params(cursor=cursor) if cursor is not None else None
+    return params, checkpoint
+
+
+def _run(name, operations_callback, stream_stop_event=None, controller=None):
+    controller = controller or ReconnectController()
+    params, checkpoint = _connect_params(name, controller)
+
+    client = _FirehoseClient(params)
+
+    process_message = _message_processor(name, client, operations_callback, checkpoint, controller)
+
     def on_message_handler(message: firehose_models.MessageFrame) -> None:
         # stop on next message if requested
         if stream_stop_event and stream_stop_event.is_set():
             client.stop()
             return
 
-        commit = parse_subscribe_repos_message(message)
+        process_message(message)
+
+    client.start(on_message_handler)
+
+
+def _message_processor(name, client, operations_callback, last_checkpoint=None, controller=None):
+    """Build the per-message handler shared by the sync and async firehose clients."""
+    def process_message(message: firehose_models.MessageFrame) -> None:
+        nonlocal last_checkpoint
+
+        # skip replayed events on the raw frame body, before building models or decoding the CAR
+        seq = message.body.get('seq')
+        if controller is not None and isinstance(seq, int) and not controller.accept(seq):
+            return
+
+        with profiling.stage('parse_message'):
+            commit = parse_subscribe_repos_message(message)
         if not isinstance(commit, models.ComAtprotoSyncSubscribeRepos.Commit):
             return
 
@@ -84,11 +164,73 @@ def _run(name, operations_callback, stream_stop_event=None):
         if commit.seq % 20 == 0:
             #logger.info(f'Updated cursor for {name} to {commit.seq}')
             client.update_params(models.ComAtprotoSyncSubscribeRepos.Params(cursor=commit.seq))
-            SubscriptionState.update(cursor=commit.seq).where(SubscriptionState.service == name).execute()
+            with profiling.stage('checkpoint_commit'):
+                SubscriptionState.update(cursor=commit.seq).where(SubscriptionState.service == name).execute()
+            last_checkpoint = commit.seq
+
+        metrics.INGEST_LAST_SEQ.set(commit.seq)
+        if last_checkpoint is not None:
+            metrics.INGEST_SEQ_GAP.set(commit.seq - last_checkpoint)
 
         if not commit.blocks:
             return
 
-        operations_callback(_get_ops_by_type(commit))
+        ops = _get_ops_by_type(commit)
+        with profiling.stage('operations_callback'):
+            operations_callback(ops)
 
-    client.start(on_message_handler)
+    return process_message
+
+
+async def run_async(name, operations_callback, stop_event: asyncio.Event, executor=None):
+    """Async counterpart of :func:`run` for the ASGI app.
+
+    The websocket lives on the event loop; decoding and ``operations_callback``
+    (which writes to SQLite) run on *executor* so serving is never blocked by ingest.
+    """
+    controller = ReconnectController()
+    while not stop_event.is_set():
+        controller.before_attempt()
+        try:
+            await _run_async(name, operations_callback, stop_event, executor, controller)
+            reason = 'closed'
+        except FirehoseError as e:
+            logger.error(f"FirehoseError encountered: {e}")
+            reason = 'firehose_error'
+        except Exception as e:
+            logger.error(f"Unhandled exception in data_stream.run_async: {e}")
+            reason = 'exception'
+
+        if stop_event.is_set():
+            break
+
+        delay = controller.failed(reason)
+        logger.error(f"Reconnecting in {delay:.1f} seconds ({reason}, circuit {controller.state})...")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _run_async(name, operations_callback, stop_event: asyncio.Event, executor=None, controller=None):
+    loop = asyncio.get_running_loop()
+    controller = controller or ReconnectController()
+
+    params, checkpoint = await loop.run_in_executor(executor, _connect_params, name, controller)
+
+    client = _AsyncFirehoseClient(params)
+
+    process_message = _message_processor(name, client, operations_callback, checkpoint, controller)
+
+    async def on_message_handler(message: firehose_models.MessageFrame) -> None:
+        await loop.run_in_executor(executor, process_message, message)
+
+    async def stop_on_event():
+        await stop_event.wait()
+        await client.stop()
+
+    stopper = asyncio.create_task(stop_on_event())
+    try:
+        await client.start(on_message_handler)
+    finally:
+        stopper.cancel()
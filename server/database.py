@@ -1,8 +1,11 @@
+import os
 from datetime import datetime
 
 import peewee
 
-db = peewee.SqliteDatabase('feed_database2.db')
+FEED_DATABASE_PATH = os.environ.get('FEED_DATABASE_PATH', 'feed_database2.db')
+
+db = peewee.SqliteDatabase(FEED_DATABASE_PATH)
 
 
 class BaseModel(peewee.Model):
@@ -0,0 +1,196 @@
+import csv
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from server.logger import logger
+
+# Near-duplicate / repost-spam detection with MinHash LSH.
+#
+# Each post is reduced to a set of word shingles and a fixed-size MinHash
+# signature. Signatures are split into bands; posts sharing any band bucket are
+# candidates, and candidates are confirmed by comparing signatures. Work per
+# post depends only on the post length and the constants below, never on how
+# many posts are indexed.
+#
+# Two indexes are kept:
+#   * deleted posts seeded from deleted_posts.tsv (what moderators removed)
+#   * a sliding window of recently accepted posts, bounded by age and size
+
+DELETED_TSV_PATH = os.environ.get('DELETED_TSV_PATH', 'deleted_posts.tsv')
+
+NUM_PERM = 64
+BANDS = 8  # 8 bands x 8 rows: ~0.77 Jaccard threshold for becoming a candidate
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+SIMILARITY_THRESHOLD = float(os.environ.get('DEDUP_SIMILARITY', 0.8))
+MAX_RECENT_DUPLICATES = int(os.environ.get('DEDUP_MAX_RECENT', 3))
+WINDOW_SECONDS = int(os.environ.get('DEDUP_WINDOW_SECONDS', 6 * 60 * 60))
+MAX_RECENT_POSTS = int(os.environ.get('DEDUP_MAX_RECENT_POSTS', 20000))
+# Candidates confirmed per lookup; caps the work done on a very popular bucket
+_MAX_CANDIDATES = 32
+_RELOAD_CHECK_SECONDS = 60
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+_URL_OR_MENTION = re.compile(r'https?://\S+|@\S+')
+_WORD = re.compile(r'\w+')
+
+
+def shingles(text: str) -> Set[str]:
+    words = _WORD.findall(_URL_OR_MENTION.sub(' ', text.lower()))
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text: str) -> Optional[Tuple[int, ...]]:
+    """MinHash signature of *text*, or None if it has no words."""
+    hashes = [hash(shingle) & _MAX_HASH for shingle in shingles(text)]
+    if not hashes:
+        return None
+
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(left, right) if x == y) / NUM_PERM
+
+
+def _band_keys(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class LSHIndex:
+    """MinHash LSH index with optional sliding-window eviction."""
+
+    def __init__(self, window_seconds: Optional[int] = None, max_entries: Optional[int] = None) -> None:
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[int]] = {}
+        self._signatures: Dict[int, Tuple[int, ...]] = {}
+        self._order = deque()  # (inserted_at, entry_id), oldest first
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def add(self, signature: Tuple[int, ...], now: Optional[float] = None) -> None:
+        entry_id = self._next_id
+        self._next_id += 1
+
+        self._signatures[entry_id] = signature
+        for key in _band_keys(signature):
+            self._buckets.setdefault(key, set()).add(entry_id)
+        self._order.append((now if now is not None else time.time(), entry_id))
+
+        self.evict(now)
+
+    def evict(self, now: Optional[float] = None) -> None:
+        now = now if now is not None else time.time()
+        while self._order and (
+            (self.max_entries is not None and len(self._order) > self.max_entries)
+            or (self.window_seconds is not None and now - self._order[0][0] > self.window_seconds)
+        ):
+            _, entry_id = self._order.popleft()
+            signature = self._signatures.pop(entry_id)
+            for key in _band_keys(signature):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(entry_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def count_similar(self, signature: Tuple[int, ...], threshold: float, limit: int) -> int:
+        """Count indexed signatures at least *threshold* similar, stopping at *limit*."""
+        seen = set()
+        matches = 0
+        for key in _band_keys(signature):
+            for entry_id in self._buckets.get(key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+
+                if similarity(signature, self._signatures[entry_id]) >= threshold:
+                    matches += 1
+                    if matches >= limit:
+                        return matches
+                if len(seen) >= _MAX_CANDIDATES:
+                    return matches
+        return matches
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._signatures.clear()
+        self._order.clear()
+
+
+class DuplicateDetector:
+    """Rejects posts that are near-duplicates of deleted posts, or of too many recent posts."""
+
+    def __init__(self, deleted_tsv_path: Optional[str] = DELETED_TSV_PATH) -> None:
+        self.deleted_tsv_path = deleted_tsv_path
+        self.deleted = LSHIndex()
+        self.recent = LSHIndex(window_seconds=WINDOW_SECONDS, max_entries=MAX_RECENT_POSTS)
+
+        self._lock = threading.Lock()
+        self._deleted_mtime = None
+        self._last_reload_check = 0.0
+        self.reload_deleted()
+
+    def reload_deleted(self) -> None:
+        """(Re)seed the deleted-post index from the moderation TSV if it changed."""
+        if not self.deleted_tsv_path or not os.path.exists(self.deleted_tsv_path):
+            return
+
+        mtime = os.path.getmtime(self.deleted_tsv_path)
+        if mtime == self._deleted_mtime:
+            return
+
+        index = LSHIndex()
+        with open(self.deleted_tsv_path, 'r', newline='', encoding='utf-8') as fh:
+            for row in csv.DictReader(fh, delimiter='\t'):
+                signature = minhash(row.get('text') or '')
+                if signature is not None:
+                    index.add(signature)
+
+        self.deleted = index
+        self._deleted_mtime = mtime
+
+    def check(self, text: str) -> Optional[str]:
+        """Return the rejection reason for *text*, or None if it should be accepted.
+
+        Accepted posts are added to the recent-post window.
+        """
+        now = time.time()
+        if now - self._last_reload_check > _RELOAD_CHECK_SECONDS:
+            self._last_reload_check = now
+            try:
+                self.reload_deleted()
+            except Exception as e:
+                logger.error(f'Failed to reload deleted posts for dedup: {e}')
+
+        signature = minhash(text)
+        if signature is None:
+            return None
+
+        with self._lock:
+            if self.deleted.count_similar(signature, SIMILARITY_THRESHOLD, limit=1):
+                return 'duplicate_of_deleted'
+
+            self.recent.evict(now)
+            if self.recent.count_similar(signature, SIMILARITY_THRESHOLD, limit=MAX_RECENT_DUPLICATES) >= MAX_RECENT_DUPLICATES:
+                return 'repeated'
+
+            self.recent.add(signature, now)
+        return None
@@ -0,0 +1,99 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Per-author flood control.
+#
+# Each author gets a two-bucket sliding-window counter: the number of posts
+# accepted in the current fixed window and in the previous one. The count over
+# the last WINDOW_SECONDS is estimated as
+#
+#     previous * (1 - fraction of the current window elapsed) + current
+#
+# which needs three numbers per author and O(1) work per post. Authors are
+# kept in an LRU-ordered dict bounded by MAX_AUTHORS; authors idle for two
+# windows (whose counters have decayed to zero) are dropped as we go.
+#
+# Caps are per user class (see config_users.json); a cap of 0 disables
+# throttling for that class.
+
+WINDOW_SECONDS = int(os.environ.get('FLOOD_WINDOW_SECONDS', 60 * 60))
+MAX_AUTHORS = int(os.environ.get('FLOOD_MAX_AUTHORS', 50000))
+
+AUTO_INCLUDE = 'auto_include'
+BIOML = 'bioml'
+GENERAL = 'general'
+
+CAPS = {
+    AUTO_INCLUDE: int(os.environ.get('FLOOD_CAP_AUTO_INCLUDE', 30)),
+    BIOML: int(os.environ.get('FLOOD_CAP_BIOML', 12)),
+    GENERAL: int(os.environ.get('FLOOD_CAP_GENERAL', 6)),
+}
+
+
+class FloodControl:
+    """Caps how many posts per author are accepted within a sliding window."""
+
+    def __init__(
+        self,
+        caps: Optional[Dict[str, int]] = None,
+        window_seconds: float = WINDOW_SECONDS,
+        max_authors: int = MAX_AUTHORS,
+    ) -> None:
+        self.caps = dict(CAPS if caps is None else caps)
+        self.window_seconds = window_seconds
+        self.max_authors = max_authors
+        # did -> [current window start, previous window count, current window count]
+        self._authors: 'OrderedDict[str, list]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._authors)
+
+    def _roll(self, entry: list, now: float) -> None:
+        windows = int((now - entry[0]) // self.window_seconds)
+        if windows > 0:
+            entry[1] = entry[2] if windows == 1 else 0
+            entry[2] = 0
+            entry[0] += windows * self.window_seconds
+
+    def _evict(self, now: float) -> None:
+        authors = self._authors
+        while len(authors) > self.max_authors:
+            authors.popitem(last=False)
+        # least recently seen first; stop at the first author still inside the decay horizon
+        while authors:
+            entry = next(iter(authors.values()))
+            if now - entry[0] < 2 * self.window_seconds:
+                break
+            authors.popitem(last=False)
+
+    def estimate(self, did: str, now: Optional[float] = None) -> float:
+        """Estimated posts accepted from *did* over the last window."""
+        entry = self._authors.get(did)
+        if entry is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        self._roll(entry, now)
+        elapsed = (now - entry[0]) / self.window_seconds
+        return entry[1] * (1.0 - elapsed) + entry[2]
+
+    def allow(self, did: str, user_class: str = GENERAL, now: Optional[float] = None) -> bool:
+        """Count a post from *did* and return True, or return False if the author is over their cap."""
+        cap = self.caps.get(user_class, 0)
+        if cap <= 0:
+            return True
+
+        now = time.monotonic() if now is None else now
+        entry = self._authors.get(did)
+        if entry is None:
+            entry = self._authors[did] = [now, 0, 0]
+            self._evict(now)
+        else:
+            self._authors.move_to_end(did)
+
+        if self.estimate(did, now) + 1 > cap:
+            return False
+
+        entry[2] += 1
+        return True
@@ -0,0 +1,41 @@
+import time
+from typing import Dict, Optional
+
+# Liveness / readiness state for /healthz and /readyz.
+#
+# Feed skeletons are served straight from the database, so the app is ready as
+# soon as the database is open. The relevance filter (large regexes,
+# config_users.json, optional classifier) and the ingest connection come up in
+# the background; /readyz reports them but does not wait for them.
+#
+# Components are only ever flipped by assigning a dict entry, which is atomic,
+# so the ingest thread can mark itself on every message without locking.
+
+REQUIRED = ('database',)
+
+_started = time.monotonic()
+_ready_at: Dict[str, Optional[float]] = {'database': None, 'filter': None, 'ingest': None}
+
+
+def mark_ready(component: str) -> None:
+    if _ready_at.get(component) is None:
+        _ready_at[component] = time.monotonic() - _started
+
+
+def mark_not_ready(component: str) -> None:
+    _ready_at[component] = None
+
+
+def is_ready() -> bool:
+    return all(_ready_at.get(component) is not None for component in REQUIRED)
+
+
+def status() -> dict:
+    """{'ready': bool, 'uptime_seconds': float, 'components': {name: seconds after start it became ready, or None}}"""
+    return {
+        'ready': is_ready(),
+        'uptime_seconds': round(time.monotonic() - _started, 3),
+        'components': {
+            name: None if ready_at is None else round(ready_at, 3) for name, ready_at in _ready_at.items()
+        },
+    }
@@ -0,0 +1,180 @@
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Optional
+from urllib.parse import urlencode
+
+from atproto import models
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+from server import data_stream
+from server import metrics
+from server import profiling
+from server.database import SubscriptionState
+from server.logger import logger
+
+# Jetstream ingest backend.
+#
+# Jetstream serves the firehose as JSON, filtered by collection on the server,
+# so we skip CBOR/CAR decoding entirely and only receive the posts we care
+# about. Events are turned into the same ops structure that
+# data_stream._get_ops_by_type produces, so operations_callback is unchanged.
+#
+# The cursor is Jetstream's `time_us` (microseconds since epoch), which is not
+# comparable with relay seq numbers, so it is stored under its own
+# SubscriptionState row. Reconnects rewind it by a few seconds, so events are
+# passed through ReconnectController.accept like firehose seqs: the gap at each
+# reconnect is recorded, and events already handled in this process are
+# skipped before they reach operations_callback (Post.uri is not unique, so a
+# replay would be stored twice).
+
+JETSTREAM_URL = os.environ.get('JETSTREAM_URL', 'wss://jetstream2.us-east.bsky.network/subscribe')
+# Path to Jetstream's zstd dictionary; compression is only requested when it is set
+JETSTREAM_ZSTD_DICTIONARY = os.environ.get('JETSTREAM_ZSTD_DICTIONARY')
+
+_WANTED_COLLECTIONS = (models.ids.AppBskyFeedPost,)
+_CURSOR_SUFFIX = ':jetstream'
+_CHECKPOINT_EVERY = 20
+# Jetstream recommends replaying a few seconds on reconnect for gapless playback
+_CURSOR_REWIND_US = 5 * 1_000_000
+_RECV_TIMEOUT = 5
+
+
+def _get_decompressor():
+    if not JETSTREAM_ZSTD_DICTIONARY:
+        return None
+
+    try:
+        import zstandard
+    except ImportError:
+        logger.error('JETSTREAM_ZSTD_DICTIONARY is set but zstandard is not installed; using uncompressed stream.')
+        return None
+
+    with open(JETSTREAM_ZSTD_DICTIONARY, 'rb') as fh:
+        dictionary = zstandard.ZstdCompressionDict(fh.read())
+    return zstandard.ZstdDecompressor(dict_data=dictionary)
+
+
+def _build_url(url: str, cursor: Optional[int], compress: bool) -> str:
+    params = [('wantedCollections', collection) for collection in _WANTED_COLLECTIONS]
+    if cursor:
+        params.append(('cursor', max(0, cursor - _CURSOR_REWIND_US)))
+    if compress:
+        params.append(('compress', 'true'))
+
+    return f'{url}?{urlencode(params)}'
+
+
+def _get_ops_by_type(event: dict) -> defaultdict:
+    operation_by_type = defaultdict(lambda: {'created': [], 'deleted': []})
+
+    commit = event.get('commit')
+    if event.get('kind') != 'commit' or not commit:
+        return operation_by_type
+
+    collection = commit['collection']
+    uri = f'at://{event["did"]}/{collection}/{commit["rkey"]}'
+    metrics.FIREHOSE_EVENTS.inc(collection)
+
+    operation = commit['operation']
+    if operation == 'create':
+        if not commit.get('cid') or not commit.get('record'):
+            return operation_by_type
+
+        with profiling.stage('record_decode'):
+            record = models.get_or_create(commit['record'], strict=False)
+        if collection == models.ids.AppBskyFeedPost and models.is_record_type(record, models.AppBskyFeedPost):
+            operation_by_type[collection]['created'].append(
+                {'record': record, 'uri': uri, 'cid': commit['cid'], 'author': event['did']}
+            )
+
+    if operation == 'delete':
+        operation_by_type[collection]['deleted'].append({'uri': uri})
+
+    return operation_by_type
+
+
+def run(name, operations_callback, stream_stop_event=None, url=JETSTREAM_URL):
+    """Drop-in replacement for :func:`server.data_stream.run` that ingests from Jetstream.
+
+    ``url`` can point at a local stand-in server (see :func:`serve_fixture`) for testing.
+    """
+    def backend(name, operations_callback, stream_stop_event=None, controller=None):
+        _run(name, operations_callback, stream_stop_event, url=url, controller=controller)
+
+    data_stream.run(name, operations_callback, stream_stop_event, backend=backend)
+
+
+def _run(name, operations_callback, stream_stop_event=None, url=JETSTREAM_URL, controller=None):
+    service = f'{name}{_CURSOR_SUFFIX}'
+    state = SubscriptionState.get_or_none(SubscriptionState.service == service)
+    if not state:
+        state = SubscriptionState.create(service=service, cursor=0)
+
+    cursor = state.cursor
+    if controller is not None:
+        cursor = controller.resume_cursor(cursor)
+    decompressor = _get_decompressor()
+    events_since_checkpoint = 0
+
+    with connect(_build_url(url, cursor, decompressor is not None), max_size=None) as websocket:
+        while stream_stop_event is None or not stream_stop_event.is_set():
+            try:
+                message = websocket.recv(timeout=_RECV_TIMEOUT)
+            except TimeoutError:
+                continue
+            except ConnectionClosed:
+                break
+
+            with profiling.stage('parse_message'):
+                if isinstance(message, bytes):
+                    message = decompressor.decompress(message) if decompressor else message
+                event = json.loads(message)
+
+            time_us = event.get('time_us')
+            if controller is not None and isinstance(time_us, int) and not controller.accept(time_us, contiguous=False):
+                continue
+            if time_us:
+                cursor = time_us
+                events_since_checkpoint += 1
+                if events_since_checkpoint >= _CHECKPOINT_EVERY:
+                    with profiling.stage('checkpoint_commit'):
+                        SubscriptionState.update(cursor=cursor).where(SubscriptionState.service == service).execute()
+                    events_since_checkpoint = 0
+
+            ops = _get_ops_by_type(event)
+            if not ops:
+                continue
+
+            with profiling.stage('operations_callback'):
+                operations_callback(ops)
+
+    SubscriptionState.update(cursor=cursor).where(SubscriptionState.service == service).execute()
+
+
+def serve_fixture(path: str, host: str = '127.0.0.1', port: int = 6008, delay: float = 0.0) -> None:
+    """Serve the JSON lines in *path* as a Jetstream stand-in, one event per message.
+
+    Point the backend at it with ``JETSTREAM_URL=ws://127.0.0.1:6008/subscribe``.
+    """
+    from websockets.sync.server import serve
+
+    def handler(websocket):
+        with open(path, 'r') as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    websocket.send(line)
+                    time.sleep(delay)
+
+    with serve(handler, host, port) as server:
+        print(f'Serving {path} on ws://{host}:{port}/subscribe')
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    import sys
+
+    serve_fixture(sys.argv[1])
@@ -1,4 +1,7 @@
+import csv
 import logging
+import os
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.ERROR)
@@ -12,4 +15,17 @@ formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
 file_handler.setFormatter(formatter)
 
 # Add the file handler to the logger
-logger.addHandler(file_handler)
\ No newline at end of file
+logger.addHandler(file_handler)
+
+
+REFRESH_LOG_PATH = os.environ.get('REFRESH_LOG_PATH', "/home/ruh/www/mlsb_feed_hosted/refresh_logs.csv")
+
+
+def log_refresh(limit: int) -> None:
+    """Append one feed refresh (timestamp, limit) to refresh_logs.csv."""
+    try:
+        with open(REFRESH_LOG_PATH, mode='a', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([datetime.now().isoformat(), limit])
+    except IOError as e:
+        print(f"Failed to write to log file: {e}")
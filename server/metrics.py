@@ -0,0 +1,243 @@
+import abc
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+# Prometheus-style metrics with per-thread shards.
+#
+# Every writer thread (the firehose thread, each Flask request thread) gets its
+# own dict of values, so incrementing never takes a lock and never contends with
+# another writer. The lock is only taken once per thread to register its shard
+# and when /metrics sums all shards together. Shards of threads that have
+# exited (e.g. Werkzeug's one-thread-per-request) are folded into a retired
+# total, so the number of shards stays bounded by the number of live threads.
+
+_DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_REGISTRY: List['_Metric'] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class _Metric(abc.ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+        _REGISTRY.append(self)
+
+    def _format_labels(self, labelvalues: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, labelvalues))
+        if extra:
+            pairs.extend(extra.items())
+        if not pairs:
+            return ''
+
+        return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for this metric, without the HELP/TYPE header."""
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class _ShardedMetric(_Metric):
+    """A metric whose writes go to a per-thread shard and are summed when scraped."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, dict]] = []
+        self._retired: dict = {}
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._lock:
+                self._reap()
+                self._shards.append((threading.current_thread(), shard))
+            self._local.shard = shard
+            return shard
+
+    @abc.abstractmethod
+    def _merge(self, into: dict, shard: dict) -> None:
+        """Add the values of *shard* into *into*."""
+
+    def _reap(self) -> None:
+        # caller holds self._lock; a dead thread can no longer write to its shard
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._merge(self._retired, shard)
+        self._shards = live
+
+    def _snapshots(self) -> List[dict]:
+        with self._lock:
+            self._reap()
+            shards = [shard for _, shard in self._shards]
+            retired = self._retired.copy()
+        # dict.copy() is atomic under the GIL, so the owner thread can keep writing
+        return [retired] + [shard.copy() for shard in shards]
+
+
+class Counter(_ShardedMetric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return sum(shard.get(labelvalues, 0) for shard in self._snapshots())
+
+    def _merge(self, into: dict, shard: dict) -> None:
+        for labelvalues, value in shard.items():
+            into[labelvalues] = into.get(labelvalues, 0) + value
+
+    def samples(self) -> List[str]:
+        totals = {}
+        for shard in self._snapshots():
+            for labelvalues, value in shard.items():
+                totals[labelvalues] = totals.get(labelvalues, 0) + value
+
+        return [f'{self.name}{self._format_labels(labelvalues)} {value}' for labelvalues, value in sorted(totals.items())]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    # Gauges are last-write-wins, so they don't shard: one shared dict is
+    # enough, a single item assignment is atomic and there is nothing to sum.
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self._values[labelvalues] = value
+
+    def value(self, *labelvalues: str) -> Optional[float]:
+        return self._values.get(labelvalues)
+
+    def samples(self) -> List[str]:
+        return [
+            f'{self.name}{self._format_labels(labelvalues)} {value}'
+            for labelvalues, value in sorted(self._values.copy().items())
+        ]
+
+
+class Histogram(_ShardedMetric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = _DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        shard = self._shard()
+        # per-bucket counts, then sum and count at the end
+        state = shard.get(labelvalues)
+        if state is None:
+            state = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            shard[labelvalues] = state
+
+        state[bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def time(self, *labelvalues: str) -> '_Timer':
+        return _Timer(self, labelvalues)
+
+    def _merge(self, into: dict, shard: dict) -> None:
+        for labelvalues, state in shard.items():
+            if labelvalues in into:
+                into[labelvalues] = [a + b for a, b in zip(into[labelvalues], state)]
+            else:
+                into[labelvalues] = list(state)
+
+    def samples(self) -> List[str]:
+        totals = {}
+        for shard in self._snapshots():
+            for labelvalues, state in shard.items():
+                state = list(state)
+                if labelvalues not in totals:
+                    totals[labelvalues] = state
+                else:
+                    totals[labelvalues] = [a + b for a, b in zip(totals[labelvalues], state)]
+
+        lines = []
+        for labelvalues, state in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{self._format_labels(labelvalues, {"le": le})} {cumulative}')
+            lines.append(f'{self.name}_sum{self._format_labels(labelvalues)} {state[-2]}')
+            lines.append(f'{self.name}_count{self._format_labels(labelvalues)} {state[-1]}')
+
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]) -> None:
+        self._histogram = histogram
+        self._labelvalues = labelvalues
+        self._start = 0.0
+
+    def __enter__(self) -> '_Timer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._histogram.observe(time.perf_counter() - self._start, *self._labelvalues)
+
+
+def render() -> str:
+    """Render all registered metrics in the Prometheus text exposition format."""
+    return '\n'.join(metric.render() for metric in _REGISTRY) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Ingest
+FIREHOSE_EVENTS = Counter('firehose_events_total', 'Firehose repo operations seen, by collection.', ('collection',))
+FIREHOSE_RECONNECTS = Counter('firehose_reconnects_total', 'Reconnects performed by data_stream.run, by reason.', ('reason',))
+INGEST_LAG_SECONDS = Gauge('ingest_lag_seconds', 'Wall-clock time minus created_at of the last ingested post.')
+INGEST_SEQ_GAP = Gauge('ingest_seq_gap', 'Firehose seq minus the last checkpointed cursor.')
+INGEST_LAST_SEQ = Gauge('ingest_last_seq', 'Last firehose seq handled.')
+INGEST_RECONNECT_GAP = Gauge('ingest_reconnect_seq_gap', 'Cursor gap at the last reconnect (positive: lost, negative: replayed), by cursor kind.', ('cursor',))
+INGEST_STREAM_GAP = Gauge('ingest_stream_seq_gap', 'Last firehose seq jump seen without a reconnect.')
+INGEST_SEQS_LOST = Counter('ingest_seqs_lost_total', 'Firehose seqs missed, across reconnects or mid-stream.')
+INGEST_SEQS_REPLAYED = Counter('ingest_seqs_replayed_total', 'Replayed events (firehose seqs or Jetstream time_us) skipped before decoding.')
+INGEST_CIRCUIT_STATE = Gauge('ingest_circuit_state', 'Reconnect circuit breaker: 0 closed, 1 half-open, 2 open.')
+INGEST_RECONNECT_DELAY_SECONDS = Gauge('ingest_reconnect_delay_seconds', 'Backoff chosen for the last reconnect.')
+OPERATIONS_CALLBACK_SECONDS = Histogram('operations_callback_seconds', 'Latency of data_filter.operations_callback.')
+CLASSIFIER_BATCH_SECONDS = Histogram('classifier_batch_seconds', 'Latency added by each relevance classifier micro-batch.')
+POSTS_ADDED = Counter('feed_posts_added_total', 'Posts added to the feed database.')
+POSTS_DELETED = Counter('feed_posts_deleted_total', 'Posts deleted from the feed database.')
+POSTS_REJECTED = Counter('feed_posts_rejected_total', 'Relevant posts rejected at ingest, by reason.', ('reason',))
+
+# Serving
+FEED_SKELETON_SECONDS = Histogram('feed_skeleton_seconds', 'Latency of getFeedSkeleton, by feed.', ('feed',))
+FEED_SKELETON_REQUESTS = Counter('feed_skeleton_requests_total', 'getFeedSkeleton responses, by feed and status.', ('feed', 'status'))
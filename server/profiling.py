@@ -0,0 +1,138 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, Optional
+
+from server.logger import logger
+
+# Per-stage hot-path timing and an on-demand sampling profiler.
+#
+# Stage timers keep the last _WINDOW durations of each stage in a bounded deque
+# (appends are atomic, so the firehose thread never blocks on a reader) and
+# report rolling percentiles on request.
+
+_WINDOW = 2048
+_PERCENTILES = (50, 90, 99)
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '.')
+PROFILE_SECONDS = int(os.environ.get('PROFILE_SECONDS', 30))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+MIN_PROFILE_SECONDS = 1
+MAX_PROFILE_SECONDS = 300
+# /debug/* routes are only served when this is set (they are not meant for the public feed host)
+DEBUG_ENDPOINTS = os.environ.get('DEBUG_ENDPOINTS', '').lower() in ('1', 'true', 'yes')
+
+_stages: Dict[str, deque] = {}
+
+
+class _Stage:
+    __slots__ = ('_samples', '_start')
+
+    def __init__(self, samples: deque) -> None:
+        self._samples = samples
+        self._start = 0.0
+
+    def __enter__(self) -> '_Stage':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._samples.append(time.perf_counter() - self._start)
+
+
+def stage(name: str) -> _Stage:
+    """Time a block of code as one sample of stage *name*.
+
+    Usage::
+
+        with profiling.stage('car_decode'):
+            car = CAR.from_bytes(commit.blocks)
+    """
+    samples = _stages.get(name)
+    if samples is None:
+        samples = _stages.setdefault(name, deque(maxlen=_WINDOW))
+    return _Stage(samples)
+
+
+def stage_percentiles() -> Dict[str, dict]:
+    """Rolling percentiles (in milliseconds) over the last samples of every stage."""
+    report = {}
+    for name, samples in list(_stages.items()):
+        values = sorted(samples)
+        if not values:
+            continue
+
+        summary = {'count': len(values), 'mean_ms': sum(values) / len(values) * 1000}
+        for percentile in _PERCENTILES:
+            index = min(len(values) - 1, int(len(values) * percentile / 100))
+            summary[f'p{percentile}_ms'] = values[index] * 1000
+        report[name] = summary
+
+    return report
+
+
+class SamplingProfiler:
+    """Sample the stacks of all threads for a fixed window and write them in
+    the collapsed-stack format understood by flamegraph.pl and speedscope.
+
+    Sampling runs on its own daemon thread, so the firehose and the web
+    server keep running while a profile is taken.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.last_output: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: int = PROFILE_SECONDS, interval: float = PROFILE_INTERVAL) -> Optional[str]:
+        """Start a profile. Returns the output path, or None if one is already running."""
+        seconds = min(max(seconds, MIN_PROFILE_SECONDS), MAX_PROFILE_SECONDS)
+        with self._lock:
+            if self.running:
+                return None
+
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            output = os.path.join(PROFILE_DIR, f'profile-{datetime.now().strftime("%Y%m%dT%H%M%S")}.collapsed')
+            self._thread = threading.Thread(
+                target=self._run, args=(seconds, interval, output), name='sampling-profiler', daemon=True
+            )
+            self._thread.start()
+            return output
+
+    def _run(self, seconds: int, interval: float, output: str) -> None:
+        own_ident = threading.get_ident()
+        stacks = Counter()
+
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+
+                stacks[';'.join(reversed(frames))] += 1
+            time.sleep(interval)
+
+        with open(output, 'w') as fh:
+            for stack, count in stacks.most_common():
+                fh.write(f'{stack} {count}\n')
+
+        self.last_output = output
+        logger.info(f'Sampling profile written to {output} ({sum(stacks.values())} samples)')
+
+
+profiler = SamplingProfiler()
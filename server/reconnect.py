@@ -0,0 +1,152 @@
+import os
+import random
+import time
+from typing import Optional
+
+from server import health
+from server import metrics
+from server.logger import logger
+
+# Reconnect control for data_stream.run. The atproto clients are built so
+# that connection errors raise out of start() instead of being retried inside
+# atproto, so every reconnect goes through this controller.
+#
+# Delays grow exponentially with jitter (half fixed, half random) so a relay
+# outage doesn't turn into a synchronized reconnect storm. After
+# RECONNECT_FAILURE_THRESHOLD consecutive attempts without a single event the
+# circuit opens and we wait RECONNECT_OPEN_SECONDS before one half-open trial
+# connection; the first event received closes it again. The backoff itself
+# only resets once a connection stayed up for RECONNECT_STABLE_SECONDS, so a
+# flapping relay keeps backing off instead of going back to the base delay.
+#
+# The controller also tracks the last cursor handled in this process (the
+# firehose seq, or Jetstream's time_us):
+#   * reconnects resume from it instead of the last checkpoint,
+#   * the gap on the first event after a reconnect is recorded as
+#     ingest_reconnect_seq_gap (positive: events lost, negative: replayed),
+#   * firehose seqs are contiguous, so a jump in the middle of a connection
+#     (seq != last seq + 1) is recorded separately as ingest_stream_seq_gap;
+#     lost seqs from both are counted. time_us cursors are not contiguous,
+#     so for Jetstream only the reconnect gap (in microseconds) is recorded,
+#   * replayed events (cursor <= last cursor) are skipped before decoding.
+
+RECONNECT_BASE_DELAY = float(os.environ.get('RECONNECT_BASE_DELAY', 1.0))
+RECONNECT_MAX_DELAY = float(os.environ.get('RECONNECT_MAX_DELAY', 120.0))
+RECONNECT_FAILURE_THRESHOLD = int(os.environ.get('RECONNECT_FAILURE_THRESHOLD', 8))
+RECONNECT_OPEN_SECONDS = float(os.environ.get('RECONNECT_OPEN_SECONDS', 180.0))
+RECONNECT_STABLE_SECONDS = float(os.environ.get('RECONNECT_STABLE_SECONDS', 60.0))
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class ReconnectController:
+    def __init__(
+        self,
+        base_delay: float = RECONNECT_BASE_DELAY,
+        max_delay: float = RECONNECT_MAX_DELAY,
+        failure_threshold: int = RECONNECT_FAILURE_THRESHOLD,
+        open_seconds: float = RECONNECT_OPEN_SECONDS,
+        stable_seconds: float = RECONNECT_STABLE_SECONDS,
+    ) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.stable_seconds = stable_seconds
+
+        self.state = CLOSED
+        self.failures = 0  # consecutive attempts that received no event (drives the circuit)
+        self.backoff_level = 0  # drops since the last stable connection (drives the delay)
+        self.last_seq: Optional[int] = None
+        self._connected_at: Optional[float] = None
+        self._awaiting_first_event = False
+        self._set_state(CLOSED)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        metrics.INGEST_CIRCUIT_STATE.set(_STATE_VALUES[state])
+
+    def connecting(self) -> None:
+        """Call before every connection attempt."""
+        self._awaiting_first_event = True
+        self._connected_at = None
+
+    def succeeded(self) -> None:
+        """Call on the first event received over a new connection."""
+        self._awaiting_first_event = False
+        self._connected_at = time.monotonic()
+        if self.state != CLOSED:
+            logger.info(f'Ingest reconnected, circuit closed after {self.failures} failure(s)')
+        self.failures = 0
+        self._set_state(CLOSED)
+        health.mark_ready('ingest')
+
+    def failed(self, reason: str) -> float:
+        """Record a dropped or failed connection and return how long to wait before the next attempt."""
+        health.mark_not_ready('ingest')
+        metrics.FIREHOSE_RECONNECTS.inc(reason)
+
+        if self._connected_at is not None and time.monotonic() - self._connected_at >= self.stable_seconds:
+            self.backoff_level = 0
+        if self._connected_at is None:
+            self.failures += 1
+        self._connected_at = None
+        self.backoff_level += 1
+
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state == CLOSED:
+                logger.error(f'Ingest circuit open after {self.failures} consecutive failures ({reason})')
+            self._set_state(OPEN)
+            delay = self.open_seconds * random.uniform(0.8, 1.2)
+        else:
+            backoff = min(self.max_delay, self.base_delay * 2 ** min(self.backoff_level - 1, 32))
+            delay = backoff / 2 + random.uniform(0, backoff / 2)
+
+        metrics.INGEST_RECONNECT_DELAY_SECONDS.set(delay)
+        return delay
+
+    def before_attempt(self) -> None:
+        """Call after waiting out a delay; an open circuit lets a single trial through."""
+        if self.state == OPEN:
+            self._set_state(HALF_OPEN)
+        self.connecting()
+
+    def resume_cursor(self, checkpoint: Optional[int]) -> Optional[int]:
+        """Cursor to reconnect from: the last seq handled in this process if it is ahead of the checkpoint."""
+        if self.last_seq is None:
+            return checkpoint
+        if checkpoint is None:
+            return self.last_seq
+        return max(checkpoint, self.last_seq)
+
+    def accept(self, seq: int, contiguous: bool = True) -> bool:
+        """
+        Called with each event's seq before it is decoded. Returns False for
+        seqs already handled in this process, which should be skipped.
+
+        Firehose seqs are contiguous; pass contiguous=False for cursors that
+        are not (Jetstream's time_us), where a jump says nothing about loss.
+        """
+        resumed = self._awaiting_first_event
+        if resumed:
+            self.succeeded()
+
+        if self.last_seq is not None:
+            gap = seq - self.last_seq - 1
+            cursor = 'seq' if contiguous else 'time_us'
+            if resumed:
+                metrics.INGEST_RECONNECT_GAP.set(gap, cursor)
+                logger.info(f'Ingest resumed at {cursor} {seq}, gap of {gap} since last handled {self.last_seq}')
+            elif contiguous and gap > 0:
+                metrics.INGEST_STREAM_GAP.set(gap)
+                logger.info(f'Ingest skipped {gap} seq(s) mid-stream after {self.last_seq}')
+            if contiguous and gap > 0:
+                metrics.INGEST_SEQS_LOST.inc(amount=gap)
+
+        if self.last_seq is not None and seq <= self.last_seq:
+            metrics.INGEST_SEQS_REPLAYED.inc()
+            return False
+
+        self.last_seq = seq
+        return True
@@ -0,0 +1,152 @@
+import csv
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from server.data_filter import relevance_decisions
+from server.database import db, Post
+from server.dedup import DELETED_TSV_PATH
+from server.tid import tid_to_datetime
+
+# Re-run the current relevance filter over every stored post.
+#
+# After ML_PATTERN / BIO_PATTERN / config_users.json change, old false
+# positives stay in the feed and newly-matching posts are never backfilled.
+# This job scores all PostContent rows (search/content_database.db) in
+# parallel worker processes, each reading its own id range, and diffs the
+# result against the Post table. Posts are scored with the same decision
+# ingest makes (relevance_decisions), so with CLASSIFIER_PATH set the
+# classifier runs over each range's candidates:
+#
+#   python -m server.refilter --content-db search/content_database.db --report refilter.tsv
+#   python -m server.refilter --content-db search/content_database.db --report refilter.tsv --apply
+
+# Posts added by hand in mlsb_delete_posts.py (filter misses); never proposed for removal
+ADDED_TSV_PATH = os.environ.get('ADDED_TSV_PATH', 'added_posts.tsv')
+
+CHUNK_SIZE = 5000
+APPLY_BATCH_SIZE = 500
+
+# Texts stored when search/data_update.py could not fetch a post
+_FETCH_FAILURES = ('Error:', 'Failed to parse URI')
+
+_content = None
+
+
+def _init_worker(content_db: str) -> None:
+    global _content
+    _content = sqlite3.connect(f'file:{content_db}?mode=ro', uri=True)
+
+
+def _score_range(id_range: Tuple[int, int]) -> Tuple[int, List[Tuple[str, str, str, bool]]]:
+    """Score posts with id in [lo, hi). Returns (rows seen, [(uri, cid, text, relevant)])."""
+    lo, hi = id_range
+    rows = _content.execute(
+        'SELECT uri, cid, content_text FROM postcontent WHERE id >= ? AND id < ?', (lo, hi)
+    ).fetchall()
+
+    rows_to_score = [
+        (uri, cid, text) for uri, cid, text in rows
+        if uri and text and not text.startswith(_FETCH_FAILURES)
+    ]
+    authors = [uri.replace('at://', '', 1).split('/')[0] for uri, _, _ in rows_to_score]
+    decisions = relevance_decisions([text for _, _, text in rows_to_score], authors)
+    return len(rows), [(uri, cid, text, relevant) for (uri, cid, text), relevant in zip(rows_to_score, decisions)]
+
+
+def _logged_cids(path: str) -> set:
+    try:
+        with open(path, 'r', newline='', encoding='utf-8') as fh:
+            return {row['cid'] for row in csv.DictReader(fh, delimiter='\t')}
+    except FileNotFoundError:
+        return set()
+
+
+def compute_diff(content_db: str, processes: Optional[int] = None, chunk_size: int = CHUNK_SIZE):
+    """Return (to_add, to_remove) lists of (uri, cid, text).
+
+    Posts a moderator deleted (deleted_posts.tsv) are never proposed for re-adding, and
+    posts a moderator added by hand (added_posts.tsv) are never proposed for removal.
+    """
+    with sqlite3.connect(f'file:{content_db}?mode=ro', uri=True) as conn:
+        max_id = conn.execute('SELECT coalesce(max(id), 0) FROM postcontent').fetchone()[0]
+
+    with db.connection_context():
+        feed_uris = {row.uri for row in Post.select(Post.uri)}
+    deleted = _logged_cids(DELETED_TSV_PATH)
+    added = _logged_cids(ADDED_TSV_PATH)
+
+    to_add, to_remove = [], []
+    ranges = [(lo, lo + chunk_size) for lo in range(0, max_id + 1, chunk_size)]
+
+    start = time.perf_counter()
+    seen = 0
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(content_db,)) as pool:
+        for count, results in pool.imap_unordered(_score_range, ranges):
+            seen += count
+            for uri, cid, text, relevant in results:
+                in_feed = uri in feed_uris
+                if relevant and not in_feed and cid not in deleted:
+                    to_add.append((uri, cid, text))
+                elif in_feed and not relevant and cid not in added:
+                    to_remove.append((uri, cid, text))
+            print(f'Scored {seen} posts ({seen / (time.perf_counter() - start):,.0f}/s)', end='\r', file=sys.stderr)
+
+    print(file=sys.stderr)
+    return to_add, to_remove
+
+
+def write_report(path: str, to_add, to_remove) -> None:
+    with open(path, 'w', newline='', encoding='utf-8') as fh:
+        writer = csv.writer(fh, delimiter='\t')
+        writer.writerow(['action', 'uri', 'cid', 'text'])
+        for action, rows in (('add', to_add), ('remove', to_remove)):
+            for uri, cid, text in rows:
+                writer.writerow([action, uri, cid, text.replace('\t', ' ').replace('\n', ' ')])
+
+
+def apply_diff(to_add, to_remove, batch_size: int = APPLY_BATCH_SIZE) -> None:
+    with db.connection_context():
+        for i in range(0, len(to_remove), batch_size):
+            with db.atomic():
+                Post.delete().where(Post.uri.in_([uri for uri, _, _ in to_remove[i:i + batch_size]])).execute()
+
+        for i in range(0, len(to_add), batch_size):
+            rows = []
+            for uri, cid, _ in to_add[i:i + batch_size]:
+                # place backfilled posts at their original time in the chronological feed
+                # (indexed_at is stored as naive UTC)
+                posted_at = tid_to_datetime(uri.rsplit('/', 1)[-1]) or datetime.now(timezone.utc)
+                indexed_at = posted_at.replace(tzinfo=None)
+                rows.append({'uri': uri, 'cid': cid, 'indexed_at': indexed_at})
+            with db.atomic():
+                Post.insert_many(rows).execute()
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Re-run the relevance filter over all stored posts.')
+    parser.add_argument('--content-db', default='search/content_database.db')
+    parser.add_argument('--report', default='refilter_report.tsv')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--apply', action='store_true', help='add/remove posts in the feed DB')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    to_add, to_remove = compute_diff(args.content_db, args.processes)
+    write_report(args.report, to_add, to_remove)
+    print(f'{len(to_add)} to add, {len(to_remove)} to remove; report written to {args.report} '
+          f'({time.perf_counter() - start:.1f}s)')
+
+    if args.apply:
+        apply_diff(to_add, to_remove)
+        print('Applied changes to the feed database.')
+
+
+if __name__ == '__main__':
+    main()
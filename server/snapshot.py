@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import time
+from typing import List, Optional
+
+from server.logger import logger
+
+# Read-only snapshots of the live SQLite databases.
+#
+# Read-heavy tools (search app, check_feed_for_cid, ...) should query a copy of
+# the feed/content DBs instead of taking locks on the files the firehose writer
+# is committing to. Each snapshot is built in a temporary file and published
+# with os.replace(), so readers see either the previous or the new snapshot,
+# never a half-written one; connections opened before the swap keep reading
+# the old inode until they close.
+#
+#   python -m server.snapshot feed_database2.db search/content_database.db --out snapshots --interval 60
+#
+# Every snapshot is a full copy made with SQLite's online backup API, which
+# works for any journal mode. It is done in a single step: a stepped backup
+# restarts whenever another connection commits to the source between steps,
+# and the firehose checkpoints SubscriptionState many times a second, so it
+# might never finish. In WAL mode (feed_database2.db) the single read
+# transaction does not block the writer; a rollback-journal source is locked
+# against commits for the length of the copy. A snapshot is skipped entirely
+# when PRAGMA data_version shows no commit since the last one, which is what
+# keeps an idle interval cheap.
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshots')
+SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 60))
+
+
+def snapshot_path(source_path: str, snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(snapshot_dir, os.path.basename(source_path))
+
+
+class SnapshotPublisher:
+    def __init__(self, source_path: str, snapshot_dir: str = SNAPSHOT_DIR) -> None:
+        self.source_path = source_path
+        self.target_path = snapshot_path(source_path, snapshot_dir)
+
+        os.makedirs(snapshot_dir, exist_ok=True)
+        # one long-lived connection so data_version can tell us whether anything was committed
+        self._source = sqlite3.connect(source_path, isolation_level=None, check_same_thread=False)
+        self._source.execute('PRAGMA busy_timeout = 5000')
+        self._data_version: Optional[int] = None
+
+    def publish(self, force: bool = False) -> Optional[int]:
+        """Publish a new snapshot if the source changed.
+
+        Returns the number of pages written, or None if the source was unchanged.
+        """
+        data_version = self._source.execute('PRAGMA data_version').fetchone()[0]
+        if not force and data_version == self._data_version and os.path.exists(self.target_path):
+            return None
+
+        tmp_path = f'{self.target_path}.tmp'
+        pages = self._backup(tmp_path)
+        os.replace(tmp_path, self.target_path)
+        self._data_version = data_version
+        return pages
+
+    def _backup(self, tmp_path: str) -> int:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        target = sqlite3.connect(tmp_path)
+        try:
+            # pages=-1: copy everything in one step so concurrent commits can't restart it
+            self._source.backup(target, pages=-1)
+            # readers only ever open snapshots read-only, so drop WAL for a single self-contained file
+            target.execute('PRAGMA journal_mode = DELETE')
+            return target.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            target.close()
+
+    def close(self) -> None:
+        self._source.close()
+
+
+def run(source_paths: List[str], snapshot_dir: str = SNAPSHOT_DIR, interval: int = SNAPSHOT_INTERVAL,
+        stop_event=None) -> None:
+    publishers = [SnapshotPublisher(path, snapshot_dir) for path in source_paths]
+    try:
+        while stop_event is None or not stop_event.is_set():
+            for publisher in publishers:
+                start = time.perf_counter()
+                try:
+                    pages = publisher.publish()
+                except sqlite3.Error as e:
+                    logger.error(f'Snapshot of {publisher.source_path} failed: {e}')
+                    continue
+                if pages is not None:
+                    print(f'Published {publisher.target_path}: {pages} page(s) in {time.perf_counter() - start:.3f}s')
+
+            if stop_event is not None:
+                stop_event.wait(interval)
+            else:
+                time.sleep(interval)
+    finally:
+        for publisher in publishers:
+            publisher.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Publish read-only snapshots of the feed/content databases.')
+    parser.add_argument('sources', nargs='+', help='SQLite files to snapshot')
+    parser.add_argument('--out', default=SNAPSHOT_DIR)
+    parser.add_argument('--interval', type=int, default=SNAPSHOT_INTERVAL)
+    args = parser.parse_args()
+
+    run(args.sources, args.out, args.interval)
@@ -0,0 +1,21 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+# TID record keys (e.g. '3lds4r3qd7c2x'): 13 base32-sortable characters whose
+# top 53 bits are microseconds since the epoch and low 10 bits a clock id.
+# Shared by server/refilter.py and search/facets.py.
+
+_TID_ALPHABET = '234567abcdefghijklmnopqrstuvwxyz'
+
+
+def tid_to_datetime(rkey: str) -> Optional[datetime]:
+    """Aware UTC creation time encoded in a TID record key, or None if *rkey* is not a TID."""
+    if len(rkey) != 13:
+        return None
+    value = 0
+    for char in rkey:
+        index = _TID_ALPHABET.find(char)
+        if index < 0:
+            return None
+        value = (value << 5) | index
+    return datetime.fromtimestamp((value >> 10) / 1_000_000, tz=timezone.utc)